@@ -58,8 +58,9 @@ class handler:
 
     def event_heartbeat(self, msg):
         if "me" in msg and "ts" in msg:
-            p.logger.info(f"Heartbeat received from {msg['me']} at {msg['ts']}")
-            socketio.emit("heartbeat", {"me": msg["me"], "ts": msg["ts"]})
+            ts = p.ts_to_iso(msg["ts"])
+            p.logger.info(f"Heartbeat received from {msg['me']} at {ts}")
+            socketio.emit("heartbeat", {"me": msg["me"], "ts": ts})
             return True
         else:
             p.logger.warning("Received heartbeat message missing 'me' or 'ts' fields")
@@ -74,17 +75,45 @@ class handler:
         
 
     def state_motion(self, msg): 
-        # Example handler for IMU state messages, expects body to contain "heading", "pitch", and "roll" fields
-        heading = msg.get("body", {}).get("heading")
-        pitch = msg.get("body", {}).get("pitch")
-        roll = msg.get("body", {}).get("roll")
-        if heading is not None and pitch is not None and roll is not None:
-            p.logger.info(f"IMU data - Heading: {heading} deg, Pitch: {pitch} deg, Roll: {roll} deg")
-            socketio.emit("imu", {"h": heading, "p": pitch, "r": roll})
-            return True
+        # Example handler for IMU state messages, expects body to contain "heading", "pitch", and "roll" fields.
+        # A batched message carries several samples; the browser only needs the newest complete one.
+        for body in reversed(p.message_samples(msg)):
+            heading = body.get("heading")
+            pitch = body.get("pitch")
+            roll = body.get("roll")
+            if heading is not None and pitch is not None and roll is not None:
+                p.logger.info(f"IMU data - Heading: {heading} deg, Pitch: {pitch} deg, Roll: {roll} deg")
+                socketio.emit("imu", {"h": heading, "p": pitch, "r": roll})
+                return True
+        p.logger.warning("Received IMU state message without required fields")
+        return False
+
+
+    def _apply_map(self, grid):
+        # Keep the full tile set so /grid-data can resync browsers. A keyframe replaces all tiles; a delta replaces
+        # the tiles it carries. The set is only complete after a keyframe: a gap in seq means missed tiles, and the
+        # set stays incomplete until the next keyframe repairs it.
+        current = shared_state["map"]
+        if grid.get("keyframe"):
+            tiles = {}
+            complete = True
         else:
-            p.logger.warning("Received IMU state message without required fields")
-            return False
+            tiles = dict(current.get("tiles", {})) # copied, /grid-data may be iterating the current one
+            complete = current.get("complete", False)
+            if current.get("seq") is not None and grid["seq"] != current["seq"] + 1:
+                p.logger.info(f"Map update {grid['seq']} follows {current['seq']}, tiles are stale until the next keyframe")
+                complete = False
+        for tile in grid["tiles"]:
+            if isinstance(tile, dict) and "tx" in tile and "ty" in tile and "rle" in tile:
+                tiles[(tile["tx"], tile["ty"])] = tile["rle"]
+        shared_state["map"] = {
+            "seq": grid["seq"],
+            "resolution_m": grid.get("resolution_m"),
+            "tile_size": grid.get("tile_size"),
+            "view_size": grid.get("view_size"),
+            "tiles": tiles,
+            "complete": complete,
+        }
 
 
     def state_pose(self, msg):
@@ -111,13 +140,13 @@ class handler:
         payload = {"x": x, "y": y, "h": h}
         pose_ts = body.get("ts", msg.get("ts"))
         if pose_ts is not None:
-            payload["ts"] = pose_ts
+            payload["ts"] = p.ts_to_iso(pose_ts)
 
-        # Forward optional preview grid when present so grid.html can render map cells.
-        preview = body.get("grid", {}).get("preview")
-        if isinstance(preview, list) and (len(preview) == 0 or isinstance(preview[0], list)):
-            payload["grid"] = {"preview": preview}
-            shared_state["map"] = preview
+        # Forward the map update when present, grid.html applies the changed tiles to its own copy.
+        grid = body.get("grid")
+        if isinstance(grid, dict) and isinstance(grid.get("tiles"), list) and isinstance(grid.get("seq"), int):
+            self._apply_map(grid)
+            payload["grid"] = grid
 
         shared_state["robot"] = [x, y, h]
 
@@ -243,9 +272,16 @@ def debug_view():
 # ---------------------------
 @app.route("/grid-data")
 def grid_data():
-    # Return the current grid and robot state as JSON for the frontend to render.
+    # Return the current grid as a keyframe and the robot state as JSON for the frontend to render. An incomplete
+    # tile set (no keyframe seen yet, or missed updates) is not sent; the browser keeps its tiles until the boss
+    # sends the next keyframe.
+    current = shared_state.get("map", {})
+    grid = {key: value for key, value in current.items() if key not in ("tiles", "complete")}
+    grid["keyframe"] = bool(current.get("complete"))
+    if grid["keyframe"]:
+        grid["tiles"] = [{"tx": tx, "ty": ty, "rle": rle} for (tx, ty), rle in current.get("tiles", {}).items()]
     return jsonify({
-        "map": shared_state.get("map", {}),
+        "map": grid,
         "robot": shared_state.get("robot", {}),
     })
 
@@ -14,12 +14,23 @@ import sys
 import zmq
 import time
 import uuid
+import heapq
+import itertools
 import threading
 import contextvars
 import logging, logging.handlers
 import oroverlib as orover
 import setproctitle
 
+try:
+    import msgpack # Optional, only needed when a process selects wire_format = msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
+# Value sets for message validation, plain sets avoid the slower (and on python 3.11 int-rejecting) Enum containment test
+_valid_sources = frozenset(int(m) for m in (*orover.controller, *orover.origin))
+_valid_priorities = frozenset(int(m) for m in orover.priority)
+
 _log_guid = contextvars.ContextVar("log_guid", default="-")
 _log_record_factory_installed = False
 
@@ -40,6 +51,119 @@ def _install_guid_log_record_factory():
     logging.setLogRecordFactory(record_factory)
     _log_record_factory_installed = True
 
+class jsoncodec:
+    """ Legacy wire format: one frame containing the topic, a space and the JSON encoded message.
+    """
+    name = "json"
+
+    def encode(self, topic, msg):
+        return [f"{topic} {json.dumps(msg)}".encode("utf-8")]
+
+    def split(self, frames):
+        # Topic and undecoded payload of a received message, raises ValueError when there is no topic separator
+        topic, sep, payload = frames[0].partition(b" ")
+        if not sep:
+            raise ValueError("unable to split topic and message")
+        return topic.decode("utf-8", errors="replace"), payload
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class msgpackcodec:
+    """ Binary wire format: a topic frame followed by a msgpack encoded message frame. Enum values stay integers.
+    """
+    name = "msgpack"
+
+    def encode(self, topic, msg):
+        return [topic.encode("utf-8"), msgpack.packb(msg)]
+
+    def split(self, frames):
+        return frames[0].decode("utf-8", errors="replace"), frames[-1]
+
+    def decode(self, payload):
+        if msgpack is None:
+            raise ValueError("msgpack message received but python package msgpack is not installed")
+        return msgpack.unpackb(payload)
+
+
+# Known wire formats. Receivers accept all of them, the sender picks one via [eventbus] wire_format.
+WIRE_CODECS = {"json": jsoncodec(), "msgpack": msgpackcodec()}
+
+
+class periodic:
+    """ Fixed rate scheduler using absolute time.monotonic() deadlines, so the period does not drift with the time
+        spent in the loop body and is not affected by wall clock changes. Records how late each tick starts
+        (jitter histogram), ticks that start after their deadline had already passed (overruns) and ticks that were
+        skipped to catch up after an overrun longer than a period.
+    """
+    jitter_buckets_ms = (0.5, 1, 2, 5, 10, 20, 50, 100) # upper bounds of the histogram buckets, plus one for larger
+
+    def __init__(self, period, immediate=False):
+        self.period = period
+        self.deadline = time.monotonic() + (0.0 if immediate else period) # start of the next tick
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.max_jitter_ms = 0.0
+        self.jitter = [0] * (len(self.jitter_buckets_ms) + 1)
+
+    def restart(self, immediate=False):
+        # Schedule the next tick relative to now, keeping the statistics
+        self.deadline = time.monotonic() + (0.0 if immediate else self.period)
+
+    def wait(self, stop_event=None):
+        # Sleep until the next deadline. Returns False when stop_event is set while waiting, True otherwise
+        delay = self.deadline - time.monotonic()
+        if delay > 0:
+            if stop_event is not None:
+                if stop_event.wait(delay):
+                    return False
+            else:
+                time.sleep(delay)
+        else:
+            self.overruns += 1
+        self._tick(time.monotonic())
+        return True
+
+    def due(self, now=None):
+        # Non-blocking variant for loops that also wait for other things: True (and counted as a tick) when the
+        # deadline has passed
+        now = time.monotonic() if now is None else now
+        if now < self.deadline:
+            return False
+        self._tick(now)
+        return True
+
+    def _tick(self, now):
+        late = now - self.deadline
+        late_ms = late * 1000.0
+        self.max_jitter_ms = max(self.max_jitter_ms, late_ms)
+        for i, bound in enumerate(self.jitter_buckets_ms):
+            if late_ms <= bound:
+                self.jitter[i] += 1
+                break
+        else:
+            self.jitter[-1] += 1
+        self.ticks += 1
+        self.deadline += self.period
+        if late > self.period:
+            # more than a period behind: skip the missed ticks instead of sending a burst to catch up
+            missed = int(late // self.period)
+            self.skipped += missed
+            self.deadline += missed * self.period
+
+    def stats(self):
+        # Counters and jitter histogram, e.g. for the heartbeat body
+        labels = [f"<={bound}" for bound in self.jitter_buckets_ms] + [f">{self.jitter_buckets_ms[-1]}"]
+        return {"period_ms": round(self.period * 1000.0, 3)
+               ,"ticks": self.ticks
+               ,"overruns": self.overruns
+               ,"skipped": self.skipped
+               ,"max_jitter_ms": round(self.max_jitter_ms, 3)
+               ,"jitter_ms": dict(zip(labels, self.jitter))}
+
+
 class handler:
     """ Contains the handlers for messages. 
         base process handler will handle all messages which should be handled by all processes, like heartbeat and logging.
@@ -64,6 +188,8 @@ class handler:
 class baseprocess:
     # Base class for all processes, providing common functionality like event handling and heartbeat
 
+    drain_limit = 100 # Maximum number of queued messages handled together by receive_pending
+
     def __init__(self,handler=None,threadingsubsocket=False):
         # Beam me up, Scotty! Initialize the process, read configuration, set up logging and ZMQ sockets, and prepare for message handling and heartbeat
 
@@ -86,22 +212,52 @@ class baseprocess:
         self.running = True
         self.pause = False
 
-        self.ctx = zmq.Context() # Create ZMQ context
-        self.pub = self.create_pub_socket(self.ctx) # Create zmq PUB socket for event bus, connect to port
-
-        if not threadingsubsocket:
-            self.sub = self.create_sub_socket(self.ctx) # Create zmq SUB socket for event bus, bind to port
-        else:
-            threading.Thread(target=self.zmq_threading_listener, daemon=True).start()
-
         self.dispatch = {}
         self.known_topics = []
+        self.topic_filter = frozenset()
+        self.bus_stats = {"received": 0, "dropped_before_decode": 0, "handled": 0, "conflated": 0} # Receive counters
+        self.queue_delay = {} # priority name -> receive queue delay statistics
+        self.schedulers = {} # name -> periodic, see scheduler()
+        self._queue_seq = itertools.count() # keeps arrival order within a priority
 
+        # Register handlers before creating the SUB socket, the handled topics determine the subscriptions
         self.handler = handler # Instantiate the handler class, which contains the message handlers for the BOSS server
         if self.handler is not None:
             self.fetchtopics()
         else:
             self.logger.warning(f"No handler class provided for {self.myname}, no message handlers will be registered") 
+
+        self.codec = self.select_codec() # Wire format used to publish messages, receiving accepts all formats
+
+        # Static envelope fields and id/timestamp generators, computed once instead of per message
+        self.host = os.uname().nodename
+        self._id_prefix = str(uuid.uuid4())[:24] # random per process 'xxxxxxxx-xxxx-4xxx-yxxx-' part of a version 4 UUID
+        self._id_counter = itertools.count()
+        self.timestamp_format = self.bus_option("timestamp_format", fallback="iso").strip().lower()
+        if self.timestamp_format not in ("iso", "ns"):
+            self.logger.error(f"Unknown timestamp_format {self.timestamp_format} in config, defaulting to 'iso'")
+            self.timestamp_format = "iso"
+        self._pub_lock = threading.Lock() # ZMQ sockets are not thread safe, publishing threads share the PUB socket
+        self.safety_endpoint = self.config.get("eventbus", "safety_socket", fallback="").strip()
+        self._safety_push = None # PUSH socket of the direct safety channel, created on first safety event
+        self.safety = None # PULL socket of the safety channel, only the motor process creates it
+
+        # Batched publishing of high rate samples, batch_size 1 sends every sample as its own message
+        self.batch_size = int(self.bus_option("batch_size", fallback="1"))
+        self.batch_max_latency = float(self.bus_option("batch_max_latency", fallback="0.1"))
+        self._batches = {} # (src, reason) -> (prio, first sample monotonic time, [samples])
+        self._batch_cond = threading.Condition()
+        self._batch_thread = None
+
+        # Latest-value conflation: for these state topics only the newest queued message is handled
+        self.conflate_topics = self.parse_topics(self.bus_option("conflate_topics", fallback=""), "conflate_topics", "state.")
+        self.ctx = zmq.Context() # Create ZMQ context
+        self.pub = self.create_pub_socket(self.ctx) # Create zmq PUB socket for event bus, connect to port
+
+        if not threadingsubsocket:
+            self.sub = self.create_sub_socket(self.ctx) # Create zmq SUB socket for event bus, bind to port
+        else:
+            threading.Thread(target=self.zmq_threading_listener, daemon=True).start()
         
         # Start done, register signal handler for graceful shutdown and log the start of the process
         signal.signal(signal.SIGTERM, self.terminate)
@@ -118,8 +274,7 @@ class baseprocess:
         # then handles the messages. Will not be called if not in threading mode.
         self.sub = self.create_sub_socket(self.ctx)
         while self.running:
-            topicmsg = self.sub.recv_string()
-            self.handle_message(topicmsg)
+            self.receive_pending(self.sub)
 
     def get_lock(self):
         # Without holding a reference to our socket somewhere it gets garbage collected when the function exits
@@ -145,6 +300,35 @@ class baseprocess:
         return os.path.splitext(script_name)[0]
 
 
+    def new_message_id(self):
+        # Return a unique message id: the random per process UUID prefix plus a 48 bit message counter, still a valid UUID4
+        return f"{self._id_prefix}{next(self._id_counter) & 0xFFFFFFFFFFFF:012x}"
+
+
+    def timestamp(self):
+        # Return the message timestamp, ISO format '%Y-%m-%dT%H:%M:%S.%f' or epoch nanoseconds when timestamp_format = ns
+        if self.timestamp_format == "ns":
+            return time.time_ns()
+        return datetime.datetime.now().isoformat(timespec="microseconds")
+
+
+    def ts_to_seconds(self, ts):
+        # Return a message timestamp (ISO string or epoch nanoseconds) as epoch seconds, None if it cannot be parsed
+        if isinstance(ts, int):
+            return ts / 1e9
+        try:
+            return datetime.datetime.fromisoformat(ts).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+
+    def ts_to_iso(self, ts):
+        # Render a message timestamp (ISO string or epoch nanoseconds) as ISO string for logging and display
+        if isinstance(ts, int):
+            return datetime.datetime.fromtimestamp(ts / 1e9).isoformat(timespec="microseconds")
+        return ts
+
+
     def log_timestamp(self):
         # Return the current timestamp in a format suitable for logging, e.g. "20240610123045" for June 10, 2024 at 12:30:45
         return datetime.datetime.now().strftime('%Y%m%d%H%M%S')
@@ -179,6 +363,38 @@ class baseprocess:
         _log_guid.reset(token)
  
 
+    def bus_option(self, key, fallback=None):
+        # Read an option from section [eventbus]. A process specific '<key>_<myname>' entry wins over the generic key
+        return self.config.get("eventbus", f"{key}_{self.myname}"
+                              ,fallback=self.config.get("eventbus", key, fallback=fallback))
+
+
+    def parse_topics(self, value, option, prefix=""):
+        # Parse a comma separated topic list from config, topics not starting with prefix are ignored with an error
+        topics = set()
+        for topic in (t.strip() for t in value.split(",")):
+            if not topic:
+                continue
+            if not topic.startswith(prefix):
+                self.logger.error(f"Topic {topic} in {option} ignored, only {prefix}* topics are allowed")
+                continue
+            topics.add(topic)
+        return frozenset(topics)
+
+
+    def select_codec(self):
+        # Select the wire format used for publishing, fall back to the legacy JSON string format if unknown or unavailable
+        name = self.bus_option("wire_format", fallback="json").strip().lower()
+        if name not in WIRE_CODECS:
+            self.logger.error(f"Unknown wire_format {name} in config, defaulting to 'json'")
+            name = "json"
+        if name == "msgpack" and msgpack is None:
+            self.logger.error("wire_format msgpack requested but python package msgpack is not installed, defaulting to 'json'")
+            name = "json"
+        self.logger.debug(f"Publishing with wire format {name}")
+        return WIRE_CODECS[name]
+
+
     def create_pub_socket(self, ctx):
         # Create a ZMQ PUB socket and connect to the event bus for publishing messages
         pub = ctx.socket(zmq.PUB)
@@ -186,41 +402,76 @@ class baseprocess:
         self.logger.debug(f"Created PUB socket and connected to {self.config.get('eventbus','client_pub_socket',fallback='tcp://localhost:5556')}")
         return pub
 
+    def send_safety(self, frames):
+        # Push a safety event directly to the motor process, bypassing the event bus proxy. Never blocks: when the
+        # receiver is not running the message is dropped, the copy on the bus is still delivered.
+        if self._safety_push is None:
+            self._safety_push = self.ctx.socket(zmq.PUSH)
+            self._safety_push.setsockopt(zmq.IMMEDIATE, 1) # only queue on established connections, no stale stops
+            self._safety_push.setsockopt(zmq.LINGER, 0)
+            self._safety_push.setsockopt(zmq.SNDHWM, 16)
+            self._safety_push.connect(self.safety_endpoint)
+            self.logger.debug(f"Created safety PUSH socket and connected to {self.safety_endpoint}")
+        try:
+            self._safety_push.send_multipart(frames, zmq.NOBLOCK)
+        except zmq.Again:
+            self.logger.debug("Safety channel has no receiver, event only sent via the bus")
+
+
+    def create_safety_socket(self, ctx):
+        # Create the receiving PULL end of the safety channel, used by the motor process only
+        if not self.safety_endpoint:
+            return None
+        safety = ctx.socket(zmq.PULL)
+        safety.bind(self.safety_endpoint)
+        self.logger.debug(f"Created safety PULL socket bound to {self.safety_endpoint}")
+        return safety
+
+
     def create_sub_socket(self, ctx):
-        # Create a ZMQ SUB socket and connect to the event bus for receiving messages, subscribe to all topics
+        # Create a ZMQ SUB socket and connect to the event bus for receiving messages. Subscribe only to the topics
+        # we have handlers for, so the bus filters all other traffic before it reaches this process.
         sub = ctx.socket(zmq.SUB)
         sub.connect(self.config.get("eventbus","client_sub_socket",fallback="tcp://localhost:5555"))
-        sub.setsockopt_string(zmq.SUBSCRIBE, "")
+        for topic in self.subscriptions():
+            sub.setsockopt_string(zmq.SUBSCRIBE, topic)
         self.logger.debug(f"Created SUB socket and connected to {self.config.get('eventbus','client_sub_socket',fallback='tcp://localhost:5555')}")
         return sub
+
+
+    def subscriptions(self):
+        # Return the topic prefixes to subscribe to. ZMQ matches prefixes, so e.g. cmd.move also matches cmd.moveTo;
+        # handle_message still checks the exact topic. [eventbus] subscribe_all restores the old subscribe-all behaviour
+        if self.bus_option("subscribe_all", fallback="False").strip().lower() in ("1", "yes", "true", "on"):
+            self.logger.debug("Subscribing to all topics")
+            return [""]
+        topics = sorted(set(self.known_topics))
+        self.logger.debug(f"Subscribing to topics {topics}")
+        return topics
         
     
     def enum_to_name(self, val) -> str:
         # Return the best-effort name for a numeric type.
-        for cls in (orover.priority, orover.operational_mode, orover.lifecycle_stage, orover.power_source,
-                    orover.health_status, orover.origin,orover.actuator, orover.controller, orover.cmd,
-                    orover.state, orover.event):
-            try:
-                return f"{cls(val).__class__.__name__}.{cls(val).name}"
-            except ValueError:
-                pass
-        return None
+        try:
+            return orover.ENUM_NAMES.get(val)
+        except TypeError: # unhashable values like lists or dicts are never enum values
+            return None
 
     
     def name_to_enum(self, name):
         # Return the best-effort number based on a name 
-        for cls in (orover.priority, orover.operational_mode, orover.lifecycle_stage, orover.power_source,
-                    orover.health_status, orover.origin,orover.actuator, orover.controller, orover.cmd,
-                    orover.state, orover.event):
-            try:
-                return cls[name]
-            except KeyError:
-                pass
-        return None
+        try:
+            return orover.ENUM_MEMBERS.get(name)
+        except TypeError:
+            return None
 
     
     def terminate(self,signalNumber, frame):
         # Signal handler for graceful shutdown of myself and child processes
+        self.flush_batches()
+        for sock in (self._safety_push, self.safety):
+            if sock is not None:
+                sock.close(0)
         self.pub.close()
         self.sub.close()
         self.ctx.term()
@@ -228,33 +479,44 @@ class baseprocess:
         sys.exit()
 
     
-    def mogrify(self, topic, msg):
-        # json encode the message and prepend the topic
-        return topic + ' ' + json.dumps(msg)
+    def split_frames(self, frames):
+        # Return topic, undecoded payload and codec of a message received from the bus. A single frame is the
+        # legacy 'topic {json}' string, multiple frames are a topic frame followed by a binary envelope
+        if isinstance(frames, str):
+            frames = [frames.encode("utf-8")]
+        codec = WIRE_CODECS["json"] if len(frames) == 1 else WIRE_CODECS["msgpack"]
+        try:
+            topic, payload = codec.split(frames)
+        except ValueError:
+            self.logger.error(f"Received malformed message: >>{frames[0][:80]!r}<<, unable to split topic and message")
+            return None, None, None
+        return topic, payload, codec
 
 
-    def demogrify(self, topicmsg):
-        # Return the topic and JSON decoded message from the topic+message string received from the bus
-        # Find first occurrence of '{' to separate topic and message, then JSON decode the message part
+    def decode_payload(self, topic, payload, codec):
+        # Decoded message of a split message, None when the codec cannot decode it
         try:
-            topic, msgtxt = topicmsg.split(' ', 1)
-        except:
-            self.logger.error(f"Received malformed message: >>{topicmsg}<<, unable to split topic and message")
+            return codec.decode(payload)
+        except Exception as e:
+            self.logger.error(f"Received undecodable {codec.name} message with topic {topic}: {e}")
+            return None
+
+
+    def demogrify(self, frames):
+        # Return the topic and decoded message from a legacy topic+message string or from multipart frames
+        topic, payload, codec = self.split_frames(frames)
+        if topic is None:
             return None, None
-        return topic, json.loads(msgtxt)
+        msg = self.decode_payload(topic, payload, codec)
+        return (topic, msg) if msg is not None else (None, None)
     
 
     def send_event(self, src, reason,body={}, prio=None):
         # Publish an event to the bus, with validation of fields and JSON body
-        msg_id = str(uuid.uuid4())
+        msg_id = self.new_message_id()
         token = self.set_log_guid(msg_id)
 
         try:
-            # find src in enums for better logging, otherwise log the numeric value
-            src_name = self.enum_to_name(src)
-            reason_name = self.enum_to_name(reason)
-            #self.logger.debug(f"Preparing to send event with src {src_name}, reason {reason_name}, body {body} and prio {prio}")
-
             if not isinstance (src,(orover.origin, orover.actuator, orover.controller)):
                 self.logger.error(f"Invalid 'src' field, must be known enum ({src})")
                 return False
@@ -282,20 +544,24 @@ class baseprocess:
 
             # Construct the message to send to the boss
             msg = {"id"  : msg_id
-                  ,"ts"  : datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')
+                  ,"ts"  : self.timestamp()
                   ,"src" : src
                   ,"me"  : self.myname
-                  ,"host": os.uname().nodename
+                  ,"host": self.host
                   ,"prio": prio
                   ,"reason": reason
                   ,"body": body_field
                   }
 
-            # create the topic string and JSON encode the message, then send to the bus
-            msgstring = self.mogrify(self.enum_to_name(reason), msg)
-            self.logger.info(f"Publishing event {self.enum_to_name(reason)}")
+            # create the topic string and encode the message in the configured wire format, then send to the bus
+            topic = orover.TOPICS[reason]
+            self.logger.info(f"Publishing event {topic}")
 
-            self.pub.send_string(msgstring)
+            frames = self.codec.encode(topic, msg)
+            with self._pub_lock:
+                if reason in orover.SAFETY_REASONS and self.safety_endpoint:
+                    self.send_safety(frames) # direct path first, the bus copy follows for all other consumers
+                self.pub.send_multipart(frames)
         except Exception as e:
             self.logger.error(f"Publishing ZMQ message failed with exception {e}")
             return False
@@ -305,19 +571,98 @@ class baseprocess:
         return True
 
     
+    def publish_sample(self, src, reason, sample, prio=None):
+        # Publish a high rate sample. With batch_size > 1 samples of the same src and reason are collected and sent
+        # as one message with body {"samples": [...]}, flushed when batch_size is reached or batch_max_latency expired.
+        # Each batched sample gets its own "ts", so consumers keep the time of the reading.
+        if self.batch_size <= 1:
+            return self.send_event(src=src, reason=reason, body=sample, prio=prio)
+
+        full = None
+        with self._batch_cond:
+            if self._batch_thread is None:
+                self._batch_thread = threading.Thread(target=self._batch_flush_loop, daemon=True)
+                self._batch_thread.start()
+            key = (src, reason)
+            if key not in self._batches:
+                self._batches[key] = (prio, time.monotonic(), [])
+                self._batch_cond.notify()
+            self._batches[key][2].append(dict(sample, ts=self.timestamp()))
+            if len(self._batches[key][2]) >= self.batch_size:
+                full = (key, self._batches.pop(key))
+        if full is not None:
+            return self._send_batch(*full)
+        return True
+
+
+    def _send_batch(self, key, batch):
+        src, reason = key
+        prio, _, samples = batch
+        return self.send_event(src=src, reason=reason, body={"samples": samples}, prio=prio)
+
+
+    def flush_batches(self):
+        # Send all pending batches regardless of their age, e.g. at shutdown
+        with self._batch_cond:
+            pending = list(self._batches.items())
+            self._batches.clear()
+        for key, batch in pending:
+            self._send_batch(key, batch)
+
+
+    def _batch_flush_loop(self):
+        # Send batches that are older than batch_max_latency, so slow streams are not delayed by the batch size
+        while self.running:
+            expired = []
+            with self._batch_cond:
+                now = time.monotonic()
+                wait = self.batch_max_latency
+                for key, batch in list(self._batches.items()):
+                    age = now - batch[1]
+                    if age >= self.batch_max_latency:
+                        expired.append((key, self._batches.pop(key)))
+                    else:
+                        wait = min(wait, self.batch_max_latency - age)
+                if not expired:
+                    self._batch_cond.wait(timeout=wait if self._batches else None)
+            for key, batch in expired:
+                self._send_batch(key, batch)
+
+
+    def message_samples(self, msg):
+        # Return the list of sample bodies of a message, a batched body {"samples": [...]} or a single plain body
+        body = msg.get("body") or {}
+        samples = body.get("samples") if isinstance(body, dict) else None
+        if isinstance(samples, list):
+            return [s for s in samples if isinstance(s, dict)]
+        return [body] if isinstance(body, dict) else []
+
+
+    def scheduler(self, name, period, immediate=False):
+        # Create a periodic scheduler; its statistics are reported in receive_stats() under this name.
+        # An existing scheduler with the same name and period is restarted, so its statistics accumulate.
+        tick = self.schedulers.get(name)
+        if tick is not None and tick.period == period:
+            tick.restart(immediate=immediate)
+            return tick
+        tick = periodic(period, immediate=immediate)
+        self.schedulers[name] = tick
+        return tick
+
     def _heartbeat_loop(self):
         # Heartbeat loop, sending a heartbeat event at the configured interval
+        tick = self.scheduler("heartbeat", self.heart_beart_interval)
         while self.running:
             self.send_event(src=self.name_to_enum(f'orover_{self.myname}')
                            ,reason=orover.event.heartbeat
-                           ,body={})
-            time.sleep(self.heart_beart_interval)
+                           ,body=self.receive_stats())
+            tick.wait()
 
     
     def all_fields_present(self, message):
         # test method to validate if all fields are present in the message
         """ "id"    : UUID
-           ,"ts"    : datetime of message in '%Y-%m-%dT%H:%M:%S.%f' format
+           ,"ts"    : datetime of message in '%Y-%m-%dT%H:%M:%S.%f' format, or epoch nanoseconds (timestamp_format = ns)
            ,"src"   : message source, e.g. specific sensor or actuator, should be in class origin
            ,"me"    : sending script name
            ,"host"  : sending node
@@ -339,13 +684,15 @@ class baseprocess:
         # test method to validate uuid
         try:
             uuid_object = uuid.UUID(id, version=4).hex
-        except ValueError:
+        except (ValueError, TypeError, AttributeError):
             return False
         return True
 
 
     def valid_datetime(self, ts):
-        # test method to validate datetime
+        # test method to validate datetime, either ISO format '%Y-%m-%dT%H:%M:%S.%f' or epoch nanoseconds
+        if isinstance(ts, int) and not isinstance(ts, bool):
+            return ts > 0
         try:
             date_object = datetime.datetime.strptime(ts,'%Y-%m-%dT%H:%M:%S.%f')
         except ValueError:
@@ -356,8 +703,8 @@ class baseprocess:
     def valid_source(self, msg):
         # test method to validate source
         try:
-            r = msg['src'] in orover.controller or msg['src'] in orover.origin
-        except:
+            r = msg['src'] in _valid_sources
+        except TypeError:
             self.logger.error(f"Exception {msg['src']}, must be in orover.controller or orover.origin")
             return False
         return r
@@ -365,7 +712,10 @@ class baseprocess:
     
     def valid_priority(self,prio):
         # test method to validate priority
-        return prio in orover.priority
+        try:
+            return prio in _valid_priorities
+        except TypeError:
+            return False
 
     
     def valid_message(self, msg):
@@ -377,7 +727,7 @@ class baseprocess:
             self.logger.error(f"Discarding message {msg} --> {msg['id']}<< is not a valid UUID version 4")
             return False
         if not self.valid_datetime(msg['ts']):
-            self.logger.error(f"Discarding message >>{msg['ts']}<< is not a valid datetime in format '%Y-%m-%dT%H:%M:%S.%f'")
+            self.logger.error(f"Discarding message >>{msg['ts']}<< is not a valid datetime in format '%Y-%m-%dT%H:%M:%S.%f' or epoch nanoseconds")
             return False
         if not self.valid_source(msg):
             self.logger.error(f"Discarding message >>{msg['src']}<< is not a valid origin")
@@ -388,17 +738,103 @@ class baseprocess:
         return True
 
 
-    def handle_message(self, topicmsg):
-        # retrieve the topic and message from the received zmq message, and validate the message structure and content
-        topic , msg = self.demogrify(topicmsg)
-        token = self.set_log_guid(msg.get("id") if isinstance(msg, dict) else "-")
+    def receive_pending(self, sock):
+        # Receive one message (blocking) plus all messages already queued on the socket into a priority queue, then
+        # handle them highest prio first and in arrival order within a prio. Between handlers the socket is drained
+        # again, so a high priority command does not wait behind a backlog of low priority state updates.
+        # For conflated state topics only the newest queued message is kept. Events and commands are always kept.
+        queue = []
+        newest = {} # conflated topic -> queue entry
+        self._drain(sock, queue, newest, block=True)
+        while queue:
+            entry = heapq.heappop(queue)
+            negprio, _, received, topic, msg = entry
+            if msg is None:
+                continue # superseded by a newer message of a conflated topic
+            if newest.get(topic) is entry:
+                del newest[topic]
+            self.record_queue_delay(-negprio, time.monotonic() - received)
+            self.process_message(topic, msg)
+            if queue:
+                self._drain(sock, queue, newest, block=False)
+
+
+    def _drain(self, sock, queue, newest, block):
+        # Move up to drain_limit messages from the socket into the priority queue, decoding only handled topics
+        received = time.monotonic()
+        for count in range(self.drain_limit):
+            try:
+                frames = sock.recv_multipart(0 if block and count == 0 else zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            topic, payload, codec = self.split_frames(frames)
+            msg = self.decode_message(topic, payload, codec)
+            if msg is None:
+                continue
+            prio = msg.get("prio")
+            if not isinstance(prio, int) or prio not in _valid_priorities:
+                prio = orover.priority.normal # invalid prio, valid_message will discard the message later
+            entry = [-prio, next(self._queue_seq), received, topic, msg]
+            if topic in self.conflate_topics:
+                older = newest.get(topic)
+                if older is not None and older[4] is not None:
+                    older[4] = None
+                    self.bus_stats["conflated"] += 1
+                newest[topic] = entry
+            heapq.heappush(queue, entry)
+
+
+    def record_queue_delay(self, prio, delay):
+        # Keep count, total and maximum of the time messages waited in the receive queue, per priority
+        stats = self.queue_delay.setdefault(orover.priority(prio).name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += delay * 1000.0
+        stats["max_ms"] = max(stats["max_ms"], delay * 1000.0)
+
+
+    def receive_stats(self):
+        # Return receive counters, queueing delay per priority and scheduler statistics, e.g. for the heartbeat body
+        delay = {prio: {"count": v["count"]
+                       ,"avg_ms": round(v["total_ms"] / v["count"], 3) if v["count"] else 0.0
+                       ,"max_ms": round(v["max_ms"], 3)}
+                 for prio, v in self.queue_delay.items()}
+        schedulers = {name: tick.stats() for name, tick in list(self.schedulers.items())}
+        return {"bus": dict(self.bus_stats), "queue_delay": delay, "schedulers": schedulers}
+
+
+    def handle_message(self, frames):
+        # retrieve the topic from the received zmq message first. Only messages for topics with a registered handler
+        # are decoded, then the message structure and content are validated and the handler is called
+        topic, payload, codec = self.split_frames(frames)
+        msg = self.decode_message(topic, payload, codec)
+        if msg is None:
+            return None
+        return self.process_message(topic, msg)
+
+
+    def decode_message(self, topic, payload, codec):
+        # Reject unhandled topics before decoding, return the decoded message or None
+        self.bus_stats["received"] += 1
+        if topic not in self.topic_filter:
+            # not an error, the SUB socket may deliver prefix matches or everything when subscribe_all is set
+            self.bus_stats["dropped_before_decode"] += 1
+            return None
+
+        msg = self.decode_payload(topic, payload, codec)
+        if msg is None:
+            return None
+        if not isinstance(msg, dict):
+            self.logger.error(f"Received message with topic {topic} is not an object: {msg}")
+            return None
+        return msg
+
+
+    def process_message(self, topic, msg):
+        # Validate a decoded message and call its handler
+        token = self.set_log_guid(msg.get("id"))
 
         try:
-            if not topic in self.known_topics:
-                # this is not an error since we might receive messages that are not relevant for this process, but log it for debugging purposes
-                 return None
-            
-            if self.pause and topic != "cmd_resume":
+            if self.pause and topic != "cmd.resume":
                 self.logger.debug(f"Process is paused, ignoring message {msg['id']} with topic {topic}")
                 return None
 
@@ -414,6 +850,7 @@ class baseprocess:
                 return None
             
             handler_routine(msg)
+            self.bus_stats["handled"] += 1
             self.logger.debug(f"Message handled : {msg}")
             return
         finally:
@@ -423,11 +860,14 @@ class baseprocess:
     def fetchtopics(self):
         # Fetch the list of topics from the handler methods defined in the handler class, and populate the dispatch dictionary and known_topics list
         for j in dir(self.handler):
-            if callable(getattr(self.handler, j)) and not j.startswith("__"):
+            # Skip dunder and private helper methods, they are not message handlers and must not become subscriptions
+            if callable(getattr(self.handler, j)) and not j.startswith("_"):
                 c, topic = j.split("_", 1)
                 self.logger.debug(f"Registering handler for topic {topic} as {self.name_to_enum(topic)}")
                 self.dispatch[self.name_to_enum(topic)] = getattr(self.handler, j)
                 self.known_topics.append(f"{c}.{topic}")
+        # Immutable lookup set used by handle_message to reject unhandled topics before decoding
+        self.topic_filter = frozenset(self.known_topics)
     
 
     def run(self):
@@ -435,8 +875,5 @@ class baseprocess:
         #self.fetchtopics() # Fetch the topics and handlers before starting the main loop
 
         while self.running:
-            # read topic and message from the SUB socket, then handle the message
-            topicmsg = self.sub.recv_string()
-            if topicmsg is None or topicmsg == "" or topicmsg is False or topicmsg is True:
-                continue
-            self.handle_message(topicmsg) 
\ No newline at end of file
+            # read all pending messages from the SUB socket, then handle them
+            self.receive_pending(self.sub) 
\ No newline at end of file
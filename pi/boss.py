@@ -10,6 +10,9 @@ import math
 import time
 import threading
 import oroverlib as orover
+import raycast
+from odometry import poseestimator
+from tilemap import tilemap
 from base_process import baseprocess
 
 
@@ -41,27 +44,36 @@ class handler:
         if d < 0:
             p.logger.warning(f"Discarded for sensor {sensor}: distance {d} is negative")
             return
-        update_grid_with_obstacle(sensor, d)
+        update_grid_with_obstacle(message.get("src"), d, body.get("sensor_angle"))
 
 
     def state_motion(self, message):
-        body = message.get("body", {})
-        try:
+        # A motion message carries one sample, or a batch {"samples": [...]} when the sender batches its readings.
+        # Each sample is fed to the pose estimator with its own timestamp.
+        for body in p.message_samples(message):
             heading = _as_float(body.get("heading"))
             roll = _as_float(body.get("roll"))
             left_speed = _as_float(body.get("left_speed"))
             right_speed = _as_float(body.get("right_speed"))
             pitch = _as_float(body.get("pitch"))
-            ts = message.get("ts")
-            if ts is not None:
+            gyro = _as_float(body.get("gz"))
+            ts = body.get("ts", message.get("ts"))
+            t = p.ts_to_seconds(ts)
+            if t is None:
+                p.logger.warning(f"Discarded motion sample without valid timestamp: {body}")
+                continue
+            p.logger.info(f"Received motion update: heading={heading} roll={roll} pitch={pitch} left_speed={left_speed} right_speed={right_speed}") 
+            p.nav_state_lock.acquire()
+            try:
                 p.nav_state["last_update_ts"] = ts
-
-        except ValueError:
-            p.logger.warning(f"Discarded motion message with invalid numeric values: {body}")
-            return True
-        p.logger.info(f"Received motion update: heading={heading} roll={roll} pitch={pitch} left_speed={left_speed} right_speed={right_speed}") 
-        # Update pose based on motion data. 
-        update_pose_from_motion(heading, left_speed, right_speed)
+                motion = p.nav_state["motion"]
+                for key, value in (("heading", heading), ("left_speed", left_speed), ("right_speed", right_speed)):
+                    if value is not None:
+                        motion[key] = value
+                p.nav_state["estimator"].add(t, left_speed, right_speed, heading, gyro)
+                update_pose()
+            finally:
+                p.nav_state_lock.release()
         return True
 
 
@@ -118,18 +130,27 @@ def _as_float(value):
         return None
 
 
-def update_pose_from_motion(heading, left_speed, right_speed):
-    now = time.time()
-    dt = max(0.0, now - p.nav_state["kinematics"]["last_time"])
-    p.nav_state["kinematics"]["last_time"] = now
-    if heading is not None:
-        p.nav_state["pose"]["heading_deg"] = heading
-    if left_speed is None or right_speed is None:
-        return
-    v = 0.5 * (left_speed + right_speed)
-    theta = math.radians(p.nav_state["pose"].get("heading_deg", 0.0) or 0.0)
-    p.nav_state["pose"]["x_m"] += v * dt * math.cos(theta)
-    p.nav_state["pose"]["y_m"] += v * dt * math.sin(theta)
+def make_estimator(config):
+    # Pose estimator with the [boss] settings of config
+    return poseestimator(
+        config.getfloat("ugv", "wheel_base", fallback=0.172),
+        heading_tau=config.getfloat("boss", "heading_filter_tau", fallback=0.5),
+        reorder_window=config.getfloat("boss", "reorder_window", fallback=0.2),
+        # ugv.py leaves out samples that did not change, so hold wheel speeds longer than its telemetry_max_silence
+        max_gap=config.getfloat("boss", "max_sample_gap",
+                                fallback=config.getfloat("ugv", "telemetry_max_silence", fallback=5.0) + 1.0),
+        gyro_scale=config.getfloat("boss", "gyro_scale", fallback=1.0),
+        gyro_max_gap=config.getfloat("boss", "gyro_max_gap", fallback=0.2),
+    )
+
+
+def update_pose():
+    # Copy the estimated pose into nav_state; the caller holds nav_state_lock
+    estimator = p.nav_state["estimator"]
+    pose = p.nav_state["pose"]
+    pose["x_m"] = estimator.x
+    pose["y_m"] = estimator.y
+    pose["heading_deg"] = estimator.heading_deg()
 
 
 def sensor_to_angle_rad(sensor_name):
@@ -142,62 +163,111 @@ def sensor_to_angle_rad(sensor_name):
     return 0.0
 
 
-def _world_to_grid(x_m, y_m):
-    origin = p.nav_state["grid"]["origin_cell"]
-    res = p.nav_state["grid"]["resolution_m"]
-    gx = int(round(origin + (x_m / res)))
-    gy = int(round(origin + (y_m / res)))
-    return gx, gy
-
-
-def _mark_cell(gx, gy, value):
-    size = p.nav_state["grid"]["size"]
-    if 0 <= gx < size and 0 <= gy < size:
-        p.nav_state["grid"]["cells"][gy][gx] = value
-
-
-def update_grid_with_obstacle(src, distance_cm):
-    # Obstacle detected by sensor at given distance. Update the occupancy grid with the obstacle position.
+def read_sensor_angles():
+    # Mounting angle in degrees (counter-clockwise from the front) per sensor id, from the [hcsr04] sensorN lines
+    angles = {}
+    n = 1
+    while True:
+        value = p.config.get("hcsr04", f"sensor{n}", fallback=None)
+        if value is None:
+            return angles
+        parts = [part.strip() for part in value.split(",")]
+        sensorid = p.name_to_enum(parts[0])
+        if len(parts) == 4 and sensorid is not None:
+            try:
+                angles[int(sensorid)] = float(parts[3])
+            except ValueError:
+                p.logger.warning(f"Ignoring non-numeric angle of [hcsr04] sensor{n}")
+        n += 1
+
+
+def update_grid_with_obstacle(src, distance_cm, sensor_angle=None):
+    # Obstacle detected by sensor at given distance. The reading is queued with the current pose and cast into the
+    # grid by update_grid, together with the other readings of the batch.
     d_cm = _as_float(distance_cm)
     if d_cm is None or d_cm <= 0:
         return
 
+    grid = p.nav_state["grid"]
     d_m = d_cm / 100.0 # Convert cm to m
-    if d_m > p.config.getfloat("boss", "max_obstacle_range_m", fallback=3.5):
+    angle = _as_float(sensor_angle)
+    if angle is None:
+        angle = grid["sensor_angles"].get(src)
+    if angle is None:
+        offset = sensor_to_angle_rad((p.enum_to_name(src) or "").lower())
+    else:
+        offset = math.radians(angle)
+
+    p.nav_state_lock.acquire()
+    try:
+        pose = p.nav_state["pose"]
+        theta = math.radians(pose.get("heading_deg", 0.0) or 0.0) + offset
+        # a reading beyond max_obstacle_range_m only clears the cells up to that range
+        grid["pending"].append((pose["x_m"], pose["y_m"], theta, min(d_m, grid["max_obstacle_range_m"]),
+                                d_m <= grid["max_obstacle_range_m"]))
+    finally:
+        p.nav_state_lock.release()
+    if grid["update_interval"] <= 0:
+        update_grid()
+
+
+def update_grid():
+    # Cast all queued readings in one vectorized batch and add them to the grid
+    grid = p.nav_state["grid"]
+    p.nav_state_lock.acquire()
+    try:
+        pending, grid["pending"] = grid["pending"], []
+    finally:
+        p.nav_state_lock.release()
+    if not pending:
         return
+    x, y, theta, ranges, hits = zip(*pending)
+    free, hit = raycast.cast(x, y, theta, ranges, hits, grid["beam_width"], grid["resolution_m"])
+    p.nav_state_lock.acquire()
+    try:
+        grid["map"].apply(free, hit)
+    finally:
+        p.nav_state_lock.release()
 
-    sensor_name = p.enum_to_name(src) or ""
-    heading_deg = p.nav_state["pose"].get("heading_deg", 0.0) or 0.0
-    theta = math.radians(heading_deg) + sensor_to_angle_rad(sensor_name.lower())
-
-    x0 = p.nav_state["pose"]["x_m"]
-    y0 = p.nav_state["pose"]["y_m"] 
-    x1 = x0 + d_m * math.cos(theta)
-    y1 = y0 + d_m * math.sin(theta)
-
-    gx0, gy0 = _world_to_grid(x0, y0)
-    gx1, gy1 = _world_to_grid(x1, y1)
 
-    _mark_cell(gx0, gy0, 0.25)
-    _mark_cell(gx1, gy1, 1.0)
+def grid_update_loop(interval_s):
+    tick = p.scheduler("grid_update", interval_s)
+    while p.running:
+        tick.wait()
+        update_grid()
 
 
-def _grid_preview(cells, max_size=21):
-    size = len(cells)
-    if size <= max_size:
-        return cells
-    start = (size - max_size) // 2
-    end = start + max_size
-    return [row[start:end] for row in cells[start:end]]
+def _map_update():
+    # Map part of the state.pose body: the tiles changed since the previous publish, or every stored tile (in memory
+    # and spilled) when a keyframe is due. Returns None when nothing changed. seq increases by one per map update, so a client that
+    # sees a gap knows it missed tiles and can resync on the next keyframe.
+    grid = p.nav_state["grid"]
+    tiles = grid["map"]
+    dirty = tiles.take_dirty()
+    now = time.monotonic()
+    keyframe = grid["keyframe_interval"] > 0 and now >= grid["next_keyframe"]
+    if not dirty and not keyframe:
+        return None
+    if keyframe:
+        grid["next_keyframe"] = now + grid["keyframe_interval"]
+        dirty = tiles.keys() # spilled tiles too, clients replace their tile set with a keyframe
+    grid["seq"] += 1
+    return {
+        "seq": grid["seq"],
+        "keyframe": keyframe,
+        "resolution_m": grid["resolution_m"],
+        "tile_size": tiles.tile_size,
+        "view_size": grid["preview_size"],
+        "tiles": tiles.encode(dirty),
+    }
 
 
 def _build_snapshot_payload():
     pose = p.nav_state["pose"]
-    grid = p.nav_state["grid"]
     motion = p.nav_state.get("motion", {})
     obstacles = p.nav_state.get("obstacles", {})
 
-    return {
+    payload = {
         "pose": {
             "x_m": round(pose["x_m"], 3),
             "y_m": round(pose["y_m"], 3),
@@ -208,19 +278,24 @@ def _build_snapshot_payload():
             "right_mps": motion.get("right_speed"),
         },
         "obstacle_count": len(obstacles),
-        "grid": {
-            "resolution_m": grid["resolution_m"],
-            "preview": _grid_preview(grid["cells"], max_size=grid["preview_size"]),
-        },
         "ts": p.nav_state.get("last_update_ts"),
     }
+    grid = _map_update()
+    if grid is not None:
+        payload["grid"] = grid
+    return payload
 
 
 def publish_pose_loop(interval_s):
+    tick = p.scheduler("pose_publish", interval_s)
     while p.running:
-        time.sleep(interval_s)
+        tick.wait()
+        update_grid()
         p.nav_state_lock.acquire()
         try:
+            # integrate the samples still held in the reorder buffer when the motion stream stalls
+            p.nav_state["estimator"].advance(time.time() - p.nav_state["estimator"].reorder_window)
+            update_pose()
             payload = _build_snapshot_payload()
         finally:
             p.nav_state_lock.release()
@@ -237,7 +312,7 @@ def snapshot_logger_loop(log_interval_s):
             obstacles = p.nav_state.get("obstacles", {})
             pose = p.nav_state.get("pose", {})
             p.logger.debug(
-                "navigation snapshot: x=%.2f y=%.2f heading=%s L=%s R=%s batt=%sV obstacles=%d",
+                "navigation snapshot: x=%.2f y=%.2f heading=%s L=%s R=%s batt=%sV obstacles=%d map=%s",
                 float(pose.get("x_m", 0.0) or 0.0),
                 float(pose.get("y_m", 0.0) or 0.0),
                 motion.get("heading"),
@@ -245,6 +320,7 @@ def snapshot_logger_loop(log_interval_s):
                 motion.get("right_speed"),
                 p.nav_state.get("battery_voltage"),
                 len(obstacles),
+                p.nav_state["grid"]["map"].stats(),
             )
         finally:
             p.nav_state_lock.release()
@@ -266,24 +342,35 @@ if __name__ == "__main__":
             "y_m": 0.0,
             "heading_deg": 0.0,
         },
-        "kinematics": {
-            "last_time": time.time(),
-        },
+        "estimator": make_estimator(p.config),
         "grid": {
-            "size": p.config.getint("boss", "grid_size", fallback=81),
             "resolution_m": p.config.getfloat("boss", "grid_resolution_m", fallback=0.10),
             "max_obstacle_range_m": p.config.getfloat("boss", "max_obstacle_range_m", fallback=3.5),
             "preview_size": p.config.getint("boss", "grid_preview_size", fallback=21),
-            "origin_cell": 0,
-            "cells": [],
+            "update_interval": p.config.getfloat("boss", "grid_update_interval", fallback=0.2),
+            "beam_width": math.radians(p.config.getfloat("hcsr04", "beam_width", fallback=15.0)),
+            "sensor_angles": {},
+            "pending": [],
+            "keyframe_interval": p.config.getfloat("boss", "map_keyframe_interval", fallback=10.0),
+            "next_keyframe": 0.0,
+            "seq": 0,
+            "map": None,
         },
         "last_update_ts": None,
     }
-    p.nav_state["grid"]["origin_cell"] = p.nav_state["grid"]["size"] // 2
-    p.nav_state["grid"]["cells"] = [
-        [0.0 for _ in range(p.nav_state["grid"]["size"])]
-        for _ in range(p.nav_state["grid"]["size"])
-    ]
+    p.nav_state["grid"]["map"] = tilemap(
+        p.nav_state["grid"]["resolution_m"],
+        tile_size=p.config.getint("boss", "tile_size", fallback=64),
+        max_tiles=p.config.getint("boss", "max_tiles", fallback=256),
+        spill_dir=p.config.get("boss", "tile_spill_dir", fallback=""),
+        log_odds_occupied=p.config.getfloat("boss", "log_odds_occupied", fallback=0.85),
+        log_odds_free=p.config.getfloat("boss", "log_odds_free", fallback=-0.4),
+        log_odds_min=p.config.getfloat("boss", "log_odds_min", fallback=-2.0),
+        log_odds_max=p.config.getfloat("boss", "log_odds_max", fallback=3.5),
+    )
+    p.nav_state["grid"]["sensor_angles"] = read_sensor_angles()
+    if p.nav_state["grid"]["update_interval"] > 0:
+        threading.Thread(target=grid_update_loop, args=(p.nav_state["grid"]["update_interval"],), daemon=True).start()
 
     log_interval = p.config.getfloat("boss", "snapshot_log_interval", fallback=5.0)
     if log_interval > 0:
@@ -7,12 +7,13 @@
 """
 import zmq
 import os
-import json
+import logging
 import threading
 from base_process import baseprocess
 
 class base(baseprocess):
      # event bus uses alternative method to create pub socket, using XSUB/XPUB sockets and zmq.proxy to allow for dynamic subscribers and publishers without needing to restart the event bus      
+     # Subscriptions of the clients travel from XPUB to XSUB and on to the publishers, so topic filtering happens before messages are sent
      def create_sub_socket(self, ctx):
           pass
 
@@ -34,15 +35,17 @@ def log_proxy_message_ids():
           if not frames:
                continue
 
-          # For multipart messages, the payload is in the last frame.
-          payload = frames[-1].decode("utf-8", errors="replace")
-          if " " not in payload:
+          # Single frames without a space are subscription changes travelling upstream from XPUB to XSUB,
+          # the publishers use them to filter topics before sending.
+          if len(frames) == 1 and b" " not in frames[0]:
+               if frames[0][:1] in (b"\x00", b"\x01"):
+                    action = "subscribed to" if frames[0][:1] == b"\x01" else "unsubscribed from"
+                    b.logger.debug(f"Event bus client {action} topic '{frames[0][1:].decode('utf-8', errors='replace')}'")
                continue
 
-          topic, msgtxt = payload.split(" ", 1)
-          try:
-               msg = json.loads(msgtxt)
-          except json.JSONDecodeError:
+          # Legacy string messages and binary multipart messages are both decoded by the base process codecs.
+          topic, msg = b.demogrify(frames)
+          if not isinstance(msg, dict):
                continue
 
           msg_id = msg.get("id")
@@ -67,7 +70,13 @@ xpub = b.ctx.socket(zmq.XPUB)
 xpub.bind(b.config.get("eventbus","bus_xpub_socket",fallback="tcp://*:5555"))
 b.logger.debug(f"Event bus XPUB socket bound to {b.config.get('eventbus','bus_xpub_socket',fallback='tcp://*:5555')}")
 
-if b.config.getboolean("eventbus","capture_message_ids",fallback=False):
+capture = b.config.getboolean("eventbus","capture_message_ids",fallback=False)
+if capture and not b.logger.isEnabledFor(logging.DEBUG):
+     # Captured ids are only logged at debug level, do not copy and decode every message for nothing.
+     b.logger.info("Event bus message ID capture requested but loglevel is above DEBUG, capture skipped")
+     capture = False
+
+if capture:
      b.logger.info("Event bus message ID capture enabled")
 
      capture_endpoint = "inproc://eventbus-capture"
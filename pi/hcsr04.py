@@ -14,16 +14,19 @@ pinlist = [2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27
 
 class ultrasonic(baseprocess):
     def loop(self,sensors,object_notify_distance,polling_interval=0.5):
+        tick = self.scheduler("sensor_poll", polling_interval)
         while True:
             #Each sensor turn by turn
             for s in sensors:
                 distance = measure_distance(s['echopin'],s['triggerpin'])
+                read_ns = time.time_ns() # sensor read time, used by ugv.py to measure the stop latency
                 if not distance is None and (distance == 0 or distance < object_notify_distance):
                     self.send_event(src = s['sensorid']
                                           ,reason = orover.event.object_detected
-                                          ,body = {"distance": distance,"sensor_angle":s["sensor_angle"]})
+                                          ,body = {"distance": distance,"sensor_angle":s["sensor_angle"],"read_ns": read_ns}
+                                          ,prio = orover.priority.high)
                         
-                time.sleep(polling_interval)
+                tick.wait()
 
 
 # Get sensor info from config.ini. Sensors should be defined in section hcsr04 as sensor1, sensor2, etc. with value "name, triggerpin, echopin"
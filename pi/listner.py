@@ -4,16 +4,27 @@
      License      MIT License, Copyright (C) 2026 C v Kruijsdijk & P. Zengers
      Description  Simple listener process for receiving messages from the event bus, just for debug purposes
 """
+import datetime
 import json
 import zmq
 import oroverlib as orover
 
-def demogrify(topicmsg):
-     # Find first occurrence of '{' to separate topic and message, then JSON decode the message part
+try:
+     import msgpack
+except ModuleNotFoundError:
+     msgpack = None
+
+def demogrify(frames):
+     # A single frame is the legacy 'topic {json}' string, multiple frames are a topic frame plus msgpack envelope
+     if len(frames) > 1:
+          if msgpack is None:
+               print(f"Received binary message for topic {frames[0].decode()}, install msgpack to decode it")
+               return None, None
+          return frames[0].decode(), msgpack.unpackb(frames[-1])
      try:
-          topic, msgtxt = topicmsg.split(' ', 1)
+          topic, msgtxt = frames[0].decode("utf-8", errors="replace").split(' ', 1)
      except ValueError:
-          print(f"Received malformed message: >>{topicmsg}<<, unable to split topic and message")
+          print(f"Received malformed message: >>{frames[0]!r}<<, unable to split topic and message")
           return None, None
         
      return topic, json.loads(msgtxt)
@@ -21,14 +32,17 @@ def demogrify(topicmsg):
 
 def enum_to_name(val) -> str:
         # Return the best-effort name for a numeric type.
-        for cls in (orover.priority, orover.operational_mode, orover.lifecycle_stage, orover.power_source,
-                    orover.health_status, orover.origin,orover.actuator, orover.controller, orover.cmd,
-                    orover.state, orover.event):
-            try:
-                return f"{cls(val).__class__.__name__}.{cls(val).name}"
-            except ValueError:
-                pass
-        return None
+        try:
+            return orover.ENUM_NAMES.get(val)
+        except TypeError:
+            return None
+
+
+def ts_to_time(ts):
+     # Return the time part of an ISO timestamp '2026-06-13T21:32:39.215813' or of epoch nanoseconds
+     if isinstance(ts, int):
+          return datetime.datetime.fromtimestamp(ts / 1e9).strftime("%H:%M:%S")
+     return str(ts).split('T')[-1][:8]
 
 
 def _parse_csv(value):
@@ -70,12 +84,12 @@ sock.connect(endpoint)
 sock.setsockopt_string(zmq.SUBSCRIBE, subscribe_filter)
 
 while True:
-    msg = sock.recv_string()
+    frames = sock.recv_multipart()
     
-    topic, msgdict = demogrify(msg)
-    if topic not in ignore_topics:
+    topic, msgdict = demogrify(frames)
+    if msgdict is not None and topic not in ignore_topics:
         # print 6 most right characters of id
         # next only time of timestamp '2026-06-13T21:32:39.215813'
-       print(f"{msgdict['id'][-13:]} {msgdict['ts'].split('T')[1][:8]} {msgdict['me'].ljust(8)} "\
+       print(f"{msgdict['id'][-13:]} {ts_to_time(msgdict['ts'])} {msgdict['me'].ljust(8)} "\
              f"{msgdict['src']} => {(enum_to_name(msgdict['src']) or '').ljust(32)} "\
              f"{msgdict['reason']} => {(enum_to_name(msgdict['reason']) or '').ljust(32)} {msgdict['body']}")
\ No newline at end of file
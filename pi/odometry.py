@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""  o R o v e r  Object Recognition and Versatile Exploration Robot
+     License      MIT License, Copyright (C) 2026 C v Kruijsdijk & P. Zengers
+     Description  differential drive pose estimator for the boss server
+"""
+
+import heapq
+import itertools
+import math
+
+
+def _wrap(angle):
+    # Angle in radians wrapped to [-pi, pi)
+    return (angle + math.pi) % (2.0 * math.pi) - math.pi
+
+
+class poseestimator:
+    """ Dead reckoning on message timestamps. Samples are held in a reorder buffer for reorder_window seconds, so
+        batched or out-of-order samples are integrated in time order; a sample older than the integrated pose is
+        dropped as late. Between samples the last wheel speeds are held for at most max_gap seconds and integrated
+        with differential drive kinematics (v = (L + R) / 2, w = (R - L) / wheel_base). The turn rate comes from the
+        gyro while its last sample is at most gyro_max_gap seconds old, else from the wheels. The IMU heading pulls
+        the integrated heading towards it with time constant heading_tau (complementary filter), which removes gyro
+        and wheel drift.
+    """
+    def __init__(self, wheel_base, heading_tau=0.5, reorder_window=0.2, max_gap=0.5, gyro_scale=1.0, gyro_max_gap=0.2):
+        self.wheel_base = wheel_base
+        self.heading_tau = heading_tau
+        self.reorder_window = reorder_window
+        self.max_gap = max_gap
+        self.gyro_scale = gyro_scale # gyro units to degrees per second, 0 ignores the gyro
+        self.gyro_max_gap = gyro_max_gap # a turn rate goes stale much faster than a wheel speed
+        self.x = 0.0
+        self.y = 0.0
+        self.theta = None # rad, continuous (not wrapped), None until the first heading or motion
+        self.time = None # timestamp (s) up to which the pose is integrated
+        self.left = self.right = 0.0
+        self.wheel_time = None
+        self.gyro = 0.0 # rad/s
+        self.gyro_time = None
+        self.heading_time = None
+        self.latest = None # newest sample timestamp seen
+        self.buffer = [] # heap of (t, order, sample)
+        self._order = itertools.count()
+        self.stats = {"samples": 0, "late": 0, "gaps": 0}
+
+    def add(self, t, left=None, right=None, heading=None, gyro=None):
+        # Queue one sample taken at t (epoch seconds): wheel speeds in m/s, IMU heading in degrees, gyro z rate in
+        # gyro units. Integrates every queued sample that is older than the reorder window.
+        if self.time is not None and t < self.time:
+            self.stats["late"] += 1
+            return
+        self.stats["samples"] += 1
+        heapq.heappush(self.buffer, (t, next(self._order), (left, right, heading, gyro)))
+        self.latest = t if self.latest is None else max(self.latest, t)
+        self.advance(self.latest - self.reorder_window)
+
+    def advance(self, until):
+        # Integrate the queued samples up to timestamp until, e.g. the wall clock minus the reorder window when
+        # the sample stream stopped
+        while self.buffer and self.buffer[0][0] <= until:
+            t, _, sample = heapq.heappop(self.buffer)
+            self._step(t, *sample)
+
+    def _step(self, t, left, right, heading, gyro):
+        if self.time is not None and t > self.time:
+            self._integrate(t - self.time)
+        self.time = t
+        if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+            self.left, self.right, self.wheel_time = float(left), float(right), t
+        if isinstance(gyro, (int, float)) and self.gyro_scale:
+            self.gyro, self.gyro_time = math.radians(gyro * self.gyro_scale), t
+        if isinstance(heading, (int, float)):
+            measured = math.radians(heading)
+            if self.theta is None or self.heading_time is None:
+                self.theta = measured
+            else:
+                elapsed = t - self.heading_time
+                gain = elapsed / (self.heading_tau + elapsed) if self.heading_tau > 0 else 1.0
+                self.theta += gain * _wrap(measured - self.theta)
+            self.heading_time = t
+
+    def _held(self, since, dt, max_gap):
+        # Part of the next dt seconds for which a value read at since is still valid
+        if since is None:
+            return 0.0
+        return max(0.0, min(dt, since + max_gap - self.time))
+
+    def _integrate(self, dt):
+        if self.theta is None:
+            self.theta = 0.0
+        wheel_dt = self._held(self.wheel_time, dt, self.max_gap)
+        if wheel_dt < dt and self.wheel_time is not None:
+            self.stats["gaps"] += 1
+        gyro_dt = self._held(self.gyro_time, dt, self.gyro_max_gap)
+        if gyro_dt == dt:
+            turn = self.gyro * dt
+        elif self.wheel_base > 0:
+            turn = (self.right - self.left) / self.wheel_base * wheel_dt
+        else:
+            turn = 0.0
+        distance = 0.5 * (self.left + self.right) * wheel_dt
+        # midpoint heading over the interval
+        mid = self.theta + turn / 2.0
+        self.x += distance * math.cos(mid)
+        self.y += distance * math.sin(mid)
+        self.theta += turn
+
+    def heading_deg(self):
+        return math.degrees(_wrap(self.theta)) if self.theta is not None else 0.0
@@ -11,6 +11,7 @@ import configparser
 from enum import IntEnum, unique
 import os
 import sys
+from types import MappingProxyType
 
 # Read configuration from the runtime config file.
 def readConfig(name_requested=False):
@@ -226,4 +227,33 @@ class event(IntEnum):
     remoteCommand                      = 6401
     heartbeat                          = 6402
     configChanged                      = 6403
-    test_message                       = 6499
\ No newline at end of file
+    test_message                       = 6499
+
+
+# -----------------------------------------
+# --- Lookup tables, built once at import ---
+# -----------------------------------------
+
+# All enum classes in lookup order. When a name or value exists in more than one class, the first class wins.
+ENUM_CLASSES = (priority, operational_mode, lifecycle_stage, power_source, health_status,
+                origin, actuator, controller, cmd, state, event)
+
+def _build_lookup_tables():
+    # Build the read-only lookup tables used on the hot path of every publish and receive
+    names, members, topics = {}, {}, {}
+    for cls in ENUM_CLASSES:
+        for member in cls:
+            names.setdefault(int(member), f"{cls.__name__}.{member.name}")
+            members.setdefault(member.name, member)
+    for cls in (cmd, state, event):
+        for member in cls:
+            topics[int(member)] = f"{cls.__name__}.{member.name}"
+    return MappingProxyType(names), MappingProxyType(members), MappingProxyType(topics)
+
+# ENUM_NAMES   value -> qualified name, e.g. 5103 -> "state.motion"
+# ENUM_MEMBERS name  -> enum member,    e.g. "motion" -> state.motion
+# TOPICS       value -> bus topic for the message reasons cmd, state and event
+ENUM_NAMES, ENUM_MEMBERS, TOPICS = _build_lookup_tables()
+
+# Events that are also sent over the direct safety channel ([eventbus] safety_socket) to the motor process
+SAFETY_REASONS = frozenset((event.emergencyStop, event.collisionDetected, event.object_detected))
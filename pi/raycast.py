@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""  o R o v e r  Object Recognition and Versatile Exploration Robot
+     License      MIT License, Copyright (C) 2026 C v Kruijsdijk & P. Zengers
+     Description  ray casting of range sensor beams into grid cells for the boss occupancy grid
+"""
+
+import math
+import numpy as np
+
+
+def fan(angles, ranges, beam_width, resolution_m):
+    # Spread each beam over its opening angle: returns (beam index, ray angle) arrays with enough rays that
+    # neighbouring rays are at most one cell apart at the end of the beam. beam_width is in radians.
+    angles = np.asarray(angles, dtype=np.float64)
+    ranges = np.asarray(ranges, dtype=np.float64)
+    if beam_width <= 0:
+        return np.arange(len(angles)), angles
+    rays = np.ceil(ranges * beam_width / resolution_m).astype(np.intp) + 1
+    beam = np.repeat(np.arange(len(angles)), rays)
+    first = np.repeat(np.cumsum(rays) - rays, rays)
+    spread = (np.arange(len(beam)) - first) / np.maximum(rays - 1, 1)[beam] - 0.5
+    spread[rays[beam] == 1] = 0.0
+    return beam, angles[beam] + spread * beam_width
+
+
+def trace(x0, y0, x1, y1):
+    # DDA line walk for many rays at once, in cell units. Returns (ray index, cx, cy) for every cell of every ray,
+    # one cell per step along the longest axis, from the start cell up to and including the end cell (last per ray).
+    x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) for v in (x0, y0, x1, y1))
+    dx, dy = x1 - x0, y1 - y0
+    steps = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.intp)
+    ray = np.repeat(np.arange(len(steps)), steps + 1)
+    first = np.repeat(np.cumsum(steps + 1) - (steps + 1), steps + 1)
+    t = (np.arange(len(ray)) - first) / np.maximum(steps, 1)[ray]
+    cx = np.rint(x0[ray] + t * dx[ray]).astype(np.intp)
+    cy = np.rint(y0[ray] + t * dy[ray]).astype(np.intp)
+    return ray, cx, cy
+
+
+def _count(beam, cx, cy):
+    # Unique cells per beam, then how many beams touched each cell: (cx, cy, count). Cells are packed into one
+    # int64 key per (beam, cell) so np.unique works on a flat array.
+    if len(beam) == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, empty
+    x_min, y_min = cx.min(), cy.min()
+    width = int(max(cx.max() - x_min, cy.max() - y_min)) + 1
+    cell = (cx - x_min).astype(np.int64) * width + (cy - y_min)
+    cell = np.unique(beam.astype(np.int64) * width * width + cell) % (width * width)
+    cell, counts = np.unique(cell, return_counts=True)
+    return (cell // width + x_min).astype(np.intp), (cell % width + y_min).astype(np.intp), counts
+
+
+def cast(x_m, y_m, angles, ranges, hits, beam_width, resolution_m):
+    # Cast a batch of readings. Per reading: sensor position (m), world beam angle (rad), measured range (m) and
+    # whether the beam hit something at that range. Cells are indexed round(coordinate / resolution_m), so cell
+    # (0, 0) holds the world origin. Returns (free, hit), each a (cx, cy, count) tuple of unique cells where count
+    # is the number of readings that passed (free) or ended (hit) in that cell. The end cells of a hit beam form
+    # an arc across the cone and are not counted as free for that reading.
+    x_m, y_m, ranges = (np.asarray(v, dtype=np.float64) for v in (x_m, y_m, ranges))
+    hits = np.asarray(hits, dtype=bool)
+    beam, ray_angles = fan(angles, ranges, beam_width, resolution_m)
+    x0, y0 = x_m[beam] / resolution_m, y_m[beam] / resolution_m
+    x1 = x0 + ranges[beam] * np.cos(ray_angles) / resolution_m
+    y1 = y0 + ranges[beam] * np.sin(ray_angles) / resolution_m
+    ray, cx, cy = trace(x0, y0, x1, y1)
+    cell_beam = beam[ray]
+
+    end = np.zeros(len(ray), dtype=bool)
+    end[np.cumsum(np.bincount(ray, minlength=len(beam))) - 1] = True
+    end &= hits[cell_beam]
+    hit = _count(cell_beam[end], cx[end], cy[end])
+
+    free = ~end
+    if end.any():
+        # drop cells that are on the arc of the same reading, a neighbouring ray may pass them before it ends
+        width = int(max(cx.max() - cx.min(), cy.max() - cy.min())) + 1
+        key = (cell_beam.astype(np.int64) * width + (cx - cx.min())) * width + (cy - cy.min())
+        free &= ~np.isin(key, key[end])
+    return _count(cell_beam[free], cx[free], cy[free]), hit
+
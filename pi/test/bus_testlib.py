@@ -23,6 +23,11 @@ from typing import Callable
 
 import zmq
 
+try:
+    import msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
 # Ensure imports from pi/ are available when running tests from pi/test.
 _HERE = os.path.dirname(os.path.abspath(__file__))
 _PI_DIR = os.path.abspath(os.path.join(_HERE, ".."))
@@ -74,6 +79,23 @@ def build_message(
     }
 
 
+def decode_frames(frames: list[bytes]) -> tuple[str | None, dict | None]:
+    """Decode legacy 'topic {json}' strings and binary topic+msgpack multipart messages."""
+    if len(frames) > 1:
+        if msgpack is None:
+            return frames[0].decode(), None
+        return frames[0].decode(), msgpack.unpackb(frames[-1])
+
+    raw = frames[0].decode("utf-8", errors="replace")
+    if " " not in raw:
+        return None, None
+    topic, payload = raw.split(" ", 1)
+    try:
+        return topic, json.loads(payload)
+    except json.JSONDecodeError:
+        return topic, None
+
+
 @dataclass(frozen=True)
 class Expectation:
     """Single expected event assertion for a test scenario."""
@@ -127,17 +149,9 @@ class BusProbe:
             if self.sub not in socks or socks[self.sub] != zmq.POLLIN:
                 continue
 
-            raw = self.sub.recv_string()
-            if " " not in raw:
-                continue
-
-            topic, payload = raw.split(" ", 1)
-            if topic != expectation.topic:
-                continue
-
-            try:
-                msg = json.loads(payload)
-            except json.JSONDecodeError:
+            frames = self.sub.recv_multipart()
+            topic, msg = decode_frames(frames)
+            if topic != expectation.topic or msg is None:
                 continue
 
             if expectation.validator(msg):
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Serial link simulator for the ESP32 General_Driver firmware.
+
+Creates a pseudo terminal and links it at the serial port configured in
+config.ini ([serial] port), so ugv.py can run without hardware. The simulator
+speaks the json_cmd.h protocol:
+- {"T":1,"L":..,"R":..} sets the wheel speeds (m/s)
+- {"T":130} answers one T=1001 base feedback frame
+- {"T":126} answers one T=1002 IMU frame
+- {"T":139} answers one T=139 speed rate frame (also sent every 1/--speed-rate-rate seconds)
+- {"T":131,"cmd":0|1} switches the continuous T=1001 feedback flow off/on; it
+  starts off like the firmware (baseFeedbackFlow = 0) and then streams at
+  --base-rate
+- {"T":136,"cmd":ms} sets the heartbeat timeout
+
+Wheel speeds follow the commands with an acceleration limit, a slip factor and
+optional noise. The simulated heading is reported in "r", the field ugv.py
+maps to heading. Without a T=1 command within the heartbeat timeout the
+wheels stop, like the firmware does.
+
+Statistics (frames sent per type, commands received, stops, frames dropped
+because the pty buffer was full) are printed every --stats-interval seconds.
+"""
+
+from __future__ import annotations
+
+import argparse
+import configparser
+import json
+import math
+import os
+import pty
+import random
+import time
+import tty
+
+from bus_testlib import default_config_path
+
+
+class EspSimulator:
+    """Simulated ESP32 base: differential drive kinematics behind a pty."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.rx_buffer = bytearray()
+
+        self.cmd_left = self.cmd_right = 0.0  # commanded wheel speeds
+        self.left = self.right = 0.0  # actual wheel speeds
+        self.x = self.y = self.theta = 0.0  # pose in m and rad
+        self.feedback_flow = False  # baseFeedbackFlow, switched on by {"T":131,"cmd":1}
+        self.heartbeat_s = args.heartbeat_ms / 1000.0
+        self.last_cmd = time.monotonic()
+
+        self.stats = {"sent": {}, "commands": 0, "stops": 0, "dropped": 0, "bytes_sent": 0, "unparsed": 0}
+
+    def link(self, path: str) -> None:
+        """Expose the pty slave at path (replacing an old link)."""
+        if os.path.islink(path):
+            os.unlink(path)
+        os.symlink(os.ttyname(self.slave), path)
+
+    def send(self, frame: dict) -> None:
+        data = (json.dumps(frame, separators=(",", ":")) + "\n").encode()
+        try:
+            os.write(self.master, data)
+        except BlockingIOError:
+            # Reader is not keeping up: a real UART drops the data as well.
+            self.stats["dropped"] += 1
+            return
+        self.stats["sent"][frame["T"]] = self.stats["sent"].get(frame["T"], 0) + 1
+        self.stats["bytes_sent"] += len(data)
+
+    def noisy(self, value: float) -> float:
+        return value + random.gauss(0.0, self.args.noise) if self.args.noise else value
+
+    def base_feedback(self) -> dict:
+        return {"T": 1001, "L": round(self.noisy(self.left), 4), "R": round(self.noisy(self.right), 4),
+                "r": round(self.heading(), 2), "p": 0.0, "y": 0.0, "temp": 31.5, "v": self.args.voltage}
+
+    def imu_feedback(self) -> dict:
+        gz = math.degrees((self.right - self.left) / self.args.wheel_base)
+        return {"T": 1002, "r": round(self.heading(), 2), "p": 0.0, "y": 0.0,
+                "ax": 0.0, "ay": 0.0, "az": 9.81, "gx": 0.0, "gy": 0.0, "gz": round(self.noisy(gz), 3),
+                "mx": 0.0, "my": 0.0, "mz": 0.0, "temp": 31.5}
+
+    def speed_rate_feedback(self) -> dict:
+        return {"T": 139, "L": 1.0, "R": 1.0}
+
+    def heading(self) -> float:
+        return (math.degrees(self.theta) + 180.0) % 360.0 - 180.0
+
+    def read_commands(self) -> None:
+        try:
+            self.rx_buffer += os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        while True:
+            end = self.rx_buffer.find(b"\n")
+            if end < 0:
+                return
+            line = bytes(self.rx_buffer[:end])
+            del self.rx_buffer[:end + 1]
+            try:
+                cmd = json.loads(line)
+                self.handle_command(cmd)
+            except (ValueError, TypeError, AttributeError):
+                self.stats["unparsed"] += 1
+
+    def handle_command(self, cmd: dict) -> None:
+        code = int(cmd.get("T"))
+        if code == 1:
+            self.cmd_left, self.cmd_right = float(cmd.get("L", 0.0)), float(cmd.get("R", 0.0))
+            self.last_cmd = time.monotonic()
+            self.stats["commands"] += 1
+            if self.cmd_left == 0.0 and self.cmd_right == 0.0:
+                self.stats["stops"] += 1
+        elif code == 130:
+            self.send(self.base_feedback())
+        elif code == 126:
+            self.send(self.imu_feedback())
+        elif code == 139:
+            self.send(self.speed_rate_feedback())
+        elif code == 131:
+            if cmd.get("cmd") in (0, 1):
+                self.feedback_flow = cmd.get("cmd") == 1
+        elif code == 136:
+            self.heartbeat_s = float(cmd.get("cmd", 3000)) / 1000.0
+
+    def step(self, dt: float) -> None:
+        """Advance the wheel speeds and pose by dt seconds."""
+        if self.heartbeat_s > 0 and time.monotonic() - self.last_cmd > self.heartbeat_s:
+            self.cmd_left = self.cmd_right = 0.0
+        max_change = self.args.max_accel * dt if self.args.max_accel > 0 else float("inf")
+        target_left = self.cmd_left * self.args.slip
+        target_right = self.cmd_right * self.args.slip
+        self.left += max(-max_change, min(max_change, target_left - self.left))
+        self.right += max(-max_change, min(max_change, target_right - self.right))
+        v = (self.left + self.right) / 2.0
+        self.theta += (self.right - self.left) / self.args.wheel_base * dt
+        self.x += v * math.cos(self.theta) * dt
+        self.y += v * math.sin(self.theta) * dt
+
+    def report(self, elapsed: float) -> None:
+        rates = {t: round(n / elapsed, 1) for t, n in sorted(self.stats["sent"].items())}
+        print(f"t={elapsed:.0f}s frames/s={rates} commands={self.stats['commands']} stops={self.stats['stops']} "
+              f"dropped={self.stats['dropped']} unparsed={self.stats['unparsed']} "
+              f"pose=({self.x:.3f} m, {self.y:.3f} m, {self.heading():.1f} deg)", flush=True)
+
+    def run(self) -> None:
+        """Simulate until --duration has passed or the user interrupts."""
+        start = time.monotonic()
+        try:
+            self._loop(start)
+        except KeyboardInterrupt:
+            pass
+        self.report(time.monotonic() - start)
+
+    def _loop(self, start: float) -> None:
+        args = self.args
+        last = next_base = next_imu = next_rate = start
+        next_stats = start + args.stats_interval
+        while args.duration <= 0 or last - start < args.duration:
+            self.read_commands()
+            now = time.monotonic()
+            self.step(now - last)
+            last = now
+            if self.feedback_flow and args.base_rate > 0 and now >= next_base:
+                self.send(self.base_feedback())
+                next_base = max(next_base + 1.0 / args.base_rate, now - 1.0 / args.base_rate)
+            if args.imu_rate > 0 and now >= next_imu:
+                self.send(self.imu_feedback())
+                next_imu = max(next_imu + 1.0 / args.imu_rate, now - 1.0 / args.imu_rate)
+            if args.speed_rate_rate > 0 and now >= next_rate:
+                self.send(self.speed_rate_feedback())
+                next_rate = max(next_rate + 1.0 / args.speed_rate_rate, now - 1.0 / args.speed_rate_rate)
+            if args.stats_interval > 0 and now >= next_stats:
+                self.report(now - start)
+                next_stats += args.stats_interval
+            time.sleep(args.tick)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Simulate the ESP32 serial link for ugv.py")
+    parser.add_argument("--config", default=default_config_path(), help="Path to config.ini, [serial] port is the link path")
+    parser.add_argument("--link", default=None, help="Link path for the pty, overrides [serial] port")
+    parser.add_argument("--base-rate", type=float, default=20.0, help="T=1001 feedback frames per second once the flow is on (T=131 cmd=1), 0 disables")
+    parser.add_argument("--imu-rate", type=float, default=0.0, help="T=1002 feedback frames per second, 0 disables")
+    parser.add_argument("--speed-rate-rate", type=float, default=0.0, help="T=139 speed rate frames per second, 0 disables")
+    parser.add_argument("--slip", type=float, default=1.0, help="Actual / commanded wheel speed")
+    parser.add_argument("--max-accel", type=float, default=1.0, help="Wheel acceleration limit in m/s^2, 0 is instant")
+    parser.add_argument("--noise", type=float, default=0.0, help="Standard deviation of the reported speed noise")
+    parser.add_argument("--wheel-base", type=float, default=0.172, help="Track width in m (TRACK_WIDTH)")
+    parser.add_argument("--voltage", type=float, default=12.1, help="Reported battery voltage")
+    parser.add_argument("--heartbeat-ms", type=float, default=3000, help="Stop the wheels without T=1 for this long, 0 disables")
+    parser.add_argument("--tick", type=float, default=0.001, help="Simulation step in seconds")
+    parser.add_argument("--duration", type=float, default=0.0, help="Run time in seconds, 0 runs until interrupted")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="Seconds between statistics lines, 0 disables")
+    args = parser.parse_args()
+
+    link = args.link
+    if link is None:
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        link = config.get("serial", "port", fallback="/tmp/orover-esp")
+    if os.path.exists(link) and not os.path.islink(link):
+        print(f"FAIL: {link} exists and is not a symlink, refusing to replace a real device")
+        return 1
+
+    sim = EspSimulator(args)
+    sim.link(link)
+    print(f"ESP simulator on {os.ttyname(sim.slave)}, linked at {link}", flush=True)
+    try:
+        sim.run()
+    finally:
+        if os.path.islink(link):
+            os.unlink(link)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
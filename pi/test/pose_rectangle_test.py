@@ -3,7 +3,8 @@
 
 """Publish synthetic state.pose messages that trace a 1 x 2 meter rectangle.
 
-This script is intended to drive the grid preview in grid.html without real hardware.
+This script is intended to drive the map view in grid.html without real hardware.
+The visited cells are published as free map tiles in the boss.py delta format.
 By default it loops forever until Ctrl+C.
 """
 
@@ -21,7 +22,10 @@ _PI_DIR = os.path.abspath(os.path.join(_HERE, ".."))
 if _PI_DIR not in sys.path:
     sys.path.insert(0, _PI_DIR)
 
+import numpy as np
+
 import oroverlib as orover
+from tilemap import tilemap
 
 from bus_testlib import BusProbe, build_message, default_config_path, enum_to_topic, read_eventbus_config
 
@@ -33,18 +37,6 @@ def _linspace(start: float, stop: float, steps: int) -> list[float]:
     return [start + i * delta for i in range(steps)]
 
 
-def _world_to_cell(x_m: float, y_m: float, cells: int, span_x_m: float, span_y_m: float) -> tuple[int, int]:
-    # Map world coordinates in [-span/2, span/2] onto grid indices.
-    nx = 0.0 if span_x_m <= 0 else (x_m + span_x_m / 2.0) / span_x_m
-    ny = 0.0 if span_y_m <= 0 else (y_m + span_y_m / 2.0) / span_y_m
-    nx = min(1.0, max(0.0, nx))
-    ny = min(1.0, max(0.0, ny))
-
-    col = int(round(nx * (cells - 1)))
-    row = int(round((1.0 - ny) * (cells - 1)))
-    return row, col
-
-
 def _build_rect_trajectory(
     width_m: float,
     height_m: float,
@@ -92,10 +84,6 @@ def _build_rect_trajectory(
     return points
 
 
-def _empty_grid(cells: int) -> list[list[float]]:
-    return [[0.0 for _ in range(cells)] for _ in range(cells)]
-
-
 def main() -> int:
     parser = argparse.ArgumentParser(description="Publish synthetic rectangular pose data for grid.html")
     parser.add_argument("--config", default=default_config_path(), help="Path to config.ini")
@@ -103,7 +91,9 @@ def main() -> int:
     parser.add_argument("--height", type=float, default=2.0, help="Rectangle height in meters (default: 2.0)")
     parser.add_argument("--step", type=float, default=0.05, help="Step size in meters along edges (default: 0.05)")
     parser.add_argument("--interval", type=float, default=0.25, help="Publish interval per pose in seconds (default: 0.25)")
-    parser.add_argument("--cells", type=int, default=41, help="Preview grid size NxN (default: 41)")
+    parser.add_argument("--cells", type=int, default=41, help="View size NxN shown by grid.html (default: 41)")
+    parser.add_argument("--resolution", type=float, default=0.05, help="Map resolution in meters per cell (default: 0.05)")
+    parser.add_argument("--keyframe-every", type=int, default=20, help="Publish all tiles every N map updates (default: 20)")
     parser.add_argument("--loops", type=int, default=1, help="Number of rectangle loops (0 = infinite)")
     parser.add_argument("--start-center", action="store_true", help="Start in center (0,0), then move to rectangle and trace it")
     args = parser.parse_args()
@@ -123,22 +113,33 @@ def main() -> int:
     print(f"INFO: rectangle={args.width}m x {args.height}m, points_per_loop={len(trajectory)}")
     print("INFO: publishing state.pose as src=orover_boss for app.py compatibility")
 
-    span_x = max(args.width * 1.4, 2.5)
-    span_y = max(args.height * 1.4, 3.0)
+    # The trail is drawn as free cells in a tile map, published like boss.py does: changed tiles per update,
+    # all tiles every --keyframe-every updates.
+    trail = tilemap(args.resolution, tile_size=32)
+    seq = 0
 
     loops_done = 0
     probe = BusProbe(pub_endpoint, sub_endpoint, subscriptions=[])
     with probe:
         try:
-            trail: set[tuple[int, int]] = set()
             while args.loops == 0 or loops_done < args.loops:
                 for x_m, y_m, heading_deg in trajectory:
-                    row, col = _world_to_cell(x_m, y_m, args.cells, span_x, span_y)
-                    trail.add((row, col))
-
-                    preview = _empty_grid(args.cells)
-                    for r, c in trail:
-                        preview[r][c] = 0.25
+                    cx = np.array([int(round(x_m / args.resolution))])
+                    cy = np.array([int(round(y_m / args.resolution))])
+                    no_hits = (cx[:0], cy[:0], cx[:0])
+                    trail.apply((cx, cy, np.ones(1, dtype=np.intp)), no_hits)
+
+                    seq += 1
+                    keyframe = args.keyframe_every > 0 and seq % args.keyframe_every == 1
+                    keys = trail.take_dirty()
+                    grid = {
+                        "seq": seq,
+                        "keyframe": keyframe,
+                        "resolution_m": args.resolution,
+                        "tile_size": trail.tile_size,
+                        "view_size": args.cells,
+                        "tiles": trail.encode(list(trail.tiles) if keyframe else keys),
+                    }
 
                     body = {
                         "pose": {
@@ -146,7 +147,7 @@ def main() -> int:
                             "y_m": round(y_m, 3),
                             "heading_deg": round(heading_deg, 2),
                         },
-                        "grid": {"preview": preview},
+                        "grid": grid,
                         "ts": dt.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"),
                     }
 
@@ -46,7 +46,19 @@ def find_duplicate_member_names():
     }
 
 
+def find_classes_missing_from_lookup_tables():
+    """Return enum class names that are not part of orover.ENUM_CLASSES and thus not in the lookup tables."""
+    return sorted(
+        enum_cls.__name__ for enum_cls in iter_orover_enums() if enum_cls not in orover.ENUM_CLASSES
+    )
+
+
 def main() -> int:
+    missing = find_classes_missing_from_lookup_tables()
+    if missing:
+        print(f"FAIL: enum classes missing from orover.ENUM_CLASSES lookup tables: {', '.join(missing)}")
+        return 1
+
     duplicates = find_duplicate_member_names()
 
     if not duplicates:
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Check the pose estimator of pi/odometry.py and how boss.py configures it.
+
+Drives the estimator with synthetic samples: straight driving, an in-place
+turn, out-of-order and batched samples inside the reorder window, late
+samples and the complementary heading filter. Finally reads a minimal config
+with non-default values and expects them on the estimator built by boss.py,
+including gyro_max_gap.
+"""
+
+from __future__ import annotations
+
+import configparser
+import math
+import os
+import sys
+
+# Ensure pi/ is on sys.path when running this script from pi/test.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PI_DIR = os.path.dirname(SCRIPT_DIR)
+if PI_DIR not in sys.path:
+    sys.path.insert(0, PI_DIR)
+
+from boss import make_estimator
+from odometry import poseestimator
+
+WHEEL_BASE = 0.2
+PERIOD = 0.05 # s between samples
+EPS = 1e-6
+
+CONFIG = """
+[ugv]
+wheel_base = 0.2
+telemetry_max_silence = 2.0
+
+[boss]
+heading_filter_tau = 0.75
+reorder_window = 0.1
+gyro_scale = 0.5
+gyro_max_gap = 0.35
+"""
+
+EXPECTED = {
+    "wheel_base": 0.2,
+    "heading_tau": 0.75,
+    "reorder_window": 0.1,
+    "max_gap": 3.0, # telemetry_max_silence + 1.0 without max_sample_gap
+    "gyro_scale": 0.5,
+    "gyro_max_gap": 0.35,
+}
+
+
+def check(failures, condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        failures.append(message)
+
+
+def wheel_samples(left, right, seconds):
+    # (t, left, right) every PERIOD seconds, from t=0 up to and including t=seconds
+    return [(round(i * PERIOD, 6), left, right) for i in range(int(round(seconds / PERIOD)) + 1)]
+
+
+def drive(samples):
+    # Estimator fed with (t, left, right) samples in the given order, integrated up to the last sample
+    estimator = poseestimator(WHEEL_BASE)
+    for t, left, right in samples:
+        estimator.add(t, left=left, right=right)
+    estimator.advance(max(t for t, _, _ in samples))
+    return estimator
+
+
+def check_straight(failures):
+    # 0.4 m/s for 2 s along the x axis
+    estimator = drive(wheel_samples(0.4, 0.4, 2.0))
+    check(failures, abs(estimator.x - 0.8) < EPS and abs(estimator.y) < EPS,
+          f"straight: pose ({estimator.x:.4f}, {estimator.y:.4f}), expected (0.8, 0)")
+    check(failures, abs(estimator.heading_deg()) < EPS, f"straight: heading {estimator.heading_deg():.3f}")
+
+
+def check_turn(failures):
+    # wheels at -/+0.1 m/s turn in place at (R - L) / wheel_base = 1 rad/s
+    estimator = drive(wheel_samples(-0.1, 0.1, 1.0))
+    expected = math.degrees(1.0)
+    check(failures, abs(estimator.heading_deg() - expected) < EPS,
+          f"turn: heading {estimator.heading_deg():.4f}, expected {expected:.4f}")
+    check(failures, abs(estimator.x) < EPS and abs(estimator.y) < EPS,
+          f"turn: moved to ({estimator.x:.4f}, {estimator.y:.4f})")
+
+
+def check_reorder(failures):
+    # an arc with changing wheel speeds, fed in order, with neighbours swapped and in batches of three
+    samples = [(round(i * PERIOD, 6), 0.2 + 0.01 * i, 0.3 - 0.005 * i) for i in range(40)]
+    reference = drive(samples)
+    swapped = list(samples)
+    for i in range(0, len(swapped) - 1, 2):
+        swapped[i], swapped[i + 1] = swapped[i + 1], swapped[i]
+    batched = []
+    for i in range(0, len(samples), 3):
+        batched.extend(reversed(samples[i:i + 3]))
+    for name, order in (("swapped", swapped), ("batched", batched)):
+        estimator = drive(order)
+        same = all(abs(a - b) < EPS for a, b in ((estimator.x, reference.x), (estimator.y, reference.y),
+                                                 (estimator.theta, reference.theta)))
+        check(failures, same, f"{name} samples: pose ({estimator.x:.4f}, {estimator.y:.4f}, "
+                              f"{estimator.heading_deg():.2f}) differs from in-order "
+                              f"({reference.x:.4f}, {reference.y:.4f}, {reference.heading_deg():.2f})")
+        check(failures, estimator.stats["late"] == 0, f"{name} samples: {estimator.stats['late']} dropped as late")
+
+
+def check_late(failures):
+    # a sample older than the integrated pose is dropped and counted
+    estimator = drive(wheel_samples(0.4, 0.4, 1.0))
+    pose = (estimator.x, estimator.y, estimator.theta)
+    estimator.add(0.5, left=1.0, right=-1.0)
+    estimator.advance(2.0)
+    check(failures, estimator.stats["late"] == 1, f"late sample: late count {estimator.stats['late']}, expected 1")
+    check(failures, (estimator.x, estimator.y, estimator.theta) == pose, "late sample changed the pose")
+
+
+def check_heading_filter(failures):
+    # standing still at heading 0, then the IMU reports 90 degrees: the heading moves towards it, filtered
+    estimator = poseestimator(WHEEL_BASE, heading_tau=0.5, reorder_window=0.0)
+    estimator.add(0.0, left=0.0, right=0.0, heading=0.0)
+    headings = []
+    for i in range(1, 41):
+        estimator.add(i * 0.1, left=0.0, right=0.0, heading=90.0)
+        headings.append(estimator.heading_deg())
+    check(failures, 0.0 < headings[0] < 45.0, f"heading filter: first step to {headings[0]:.2f}, expected filtered")
+    check(failures, all(b > a for a, b in zip(headings, headings[1:])), "heading filter: not converging monotonically")
+    check(failures, abs(headings[-1] - 90.0) < 0.1, f"heading filter: {headings[-1]:.3f} after 4 s, expected 90")
+
+
+def check_config(failures):
+    config = configparser.ConfigParser()
+    config.read_string(CONFIG)
+    estimator = make_estimator(config)
+    for name, expected in EXPECTED.items():
+        value = getattr(estimator, name)
+        check(failures, value == expected, f"config: {name} = {value}, expected {expected}")
+
+
+def main() -> int:
+    failures = []
+    check_straight(failures)
+    check_turn(failures)
+    check_reorder(failures)
+    check_late(failures)
+    check_heading_filter(failures)
+    check_config(failures)
+    if failures:
+        return 1
+    print(f"PASS: estimator motion, reordering, late samples, heading filter and {len(EXPECTED)} config settings")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
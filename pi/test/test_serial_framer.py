@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Check the newline framer used by ugv.py for ESP32 serial input.
+
+Feeds the framer with split, merged, oversized and CRLF terminated frames and
+compares the returned frames with the expected ones.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+# Ensure pi/ is on sys.path when running this script from pi/test.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PI_DIR = os.path.dirname(SCRIPT_DIR)
+if PI_DIR not in sys.path:
+    sys.path.insert(0, PI_DIR)
+
+from ugv import lineframer
+
+
+CASES = [
+    # (name, chunks, max_frame_length, expected frames, expected oversized count)
+    ("single frame", [b'{"T":1001}\n'], 64, [b'{"T":1001}'], 0),
+    ("crlf and empty lines", [b'{"T":1}\r\n\r\n\n'], 64, [b'{"T":1}'], 0),
+    ("surrounding whitespace", [b' \t{"T":1} \r\n  \r\n'], 64, [b'{"T":1}'], 0),
+    ("frame split over chunks", [b'{"T"', b':1002,', b'"r":1}\n'], 64, [b'{"T":1002,"r":1}'], 0),
+    ("several frames in one chunk", [b'a\nb\nc'], 64, [b"a", b"b"], 0),
+    ("oversized complete frame", [b"x" * 20 + b"\nok\n"], 10, [b"ok"], 1),
+    ("oversized partial frame", [b"x" * 20, b"yyy\nok\n"], 10, [b"ok"], 1),
+]
+
+
+def run_case(chunks, max_frame_length):
+    """Feed all chunks and return (frames, oversized count)."""
+    framer = lineframer(max_frame_length)
+    frames = []
+    for chunk in chunks:
+        frames.extend(framer.feed(chunk))
+    return frames, framer.oversized
+
+
+def main() -> int:
+    failures = 0
+    for name, chunks, max_frame_length, expected, expected_oversized in CASES:
+        frames, oversized = run_case(chunks, max_frame_length)
+        if frames != expected or oversized != expected_oversized:
+            print(f"FAIL: {name}: frames={frames} oversized={oversized}, "
+                  f"expected frames={expected} oversized={expected_oversized}")
+            failures += 1
+
+    if failures:
+        return 1
+    print(f"PASS: {len(CASES)} serial framer cases")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Check the sparse tile map used by boss.py for the occupancy grid.
+
+Touches more tiles than max_tiles with a spill directory, then checks that a
+keyframe (encode of all stored keys) holds every tile with the right values,
+and that encoding does not reload spilled tiles or change the LRU order.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Ensure pi/ is on sys.path when running this script from pi/test.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PI_DIR = os.path.dirname(SCRIPT_DIR)
+if PI_DIR not in sys.path:
+    sys.path.insert(0, PI_DIR)
+
+from tilemap import decode_tile, encode_tile, tilemap
+
+TILE_SIZE = 8
+TOUCHED_TILES = 5
+MAX_TILES = 2
+
+
+def check(failures, condition, message):
+    if not condition:
+        print(f"FAIL: {message}")
+        failures.append(message)
+
+
+def main() -> int:
+    failures = []
+    with tempfile.TemporaryDirectory() as spill_dir:
+        tiles = tilemap(0.05, tile_size=TILE_SIZE, max_tiles=MAX_TILES, spill_dir=spill_dir)
+        # one free cell in each of TOUCHED_TILES tiles along x, one hit more per tile index
+        cx = np.arange(TOUCHED_TILES, dtype=np.intp) * TILE_SIZE + 1
+        cy = np.full(TOUCHED_TILES, 2, dtype=np.intp)
+        counts = np.arange(1, TOUCHED_TILES + 1, dtype=np.intp)
+        tiles.apply((cx, cy, np.ones(TOUCHED_TILES, dtype=np.intp)), (cx, cy, counts))
+
+        expected_keys = {(tx, 0) for tx in range(TOUCHED_TILES)}
+        check(failures, len(tiles.tiles) == MAX_TILES, f"{len(tiles.tiles)} tiles in memory, expected {MAX_TILES}")
+        check(failures, tiles.keys() == expected_keys, f"stored keys {sorted(tiles.keys())}")
+
+        order = list(tiles.tiles)
+        spilled = set(tiles.spilled)
+        keyframe = tiles.encode(tiles.keys())
+        check(failures, list(tiles.tiles) == order, "encode changed the tiles in memory or their LRU order")
+        check(failures, tiles.spilled == spilled, "encode changed the spilled tiles")
+        check(failures, all(os.path.exists(tiles._spill_path(key)) for key in spilled), "encode removed spill files")
+
+        check(failures, {(t["tx"], t["ty"]) for t in keyframe} == expected_keys,
+              f"keyframe tiles {[(t['tx'], t['ty']) for t in keyframe]}")
+        for tile in keyframe:
+            cells = decode_tile(tile["rle"], TILE_SIZE)
+            expected = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.float32)
+            expected[2, 1] = np.clip(tiles.log_odds_free + (tile["tx"] + 1) * tiles.log_odds_occupied,
+                                     tiles.log_odds_min, tiles.log_odds_max)
+            check(failures, np.array_equal(cells, decode_tile(encode_tile(expected), TILE_SIZE)),
+                  f"tile {tile['tx']},{tile['ty']} values differ")
+
+    if failures:
+        return 1
+    print(f"PASS: keyframe holds {TOUCHED_TILES} tiles with max_tiles={MAX_TILES}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
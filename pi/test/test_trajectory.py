@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Check the route merging and speed profiles of pi/trajectory.py.
+
+merge_steps must only merge consecutive steps of the same kind, wheel speeds
+and direction, and leave zero length parts out. profile must respect the
+acceleration and jerk limits, never command less than min_scale and ramp on
+from an initial speed.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+
+# Ensure pi/ is on sys.path when running this script from pi/test.
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PI_DIR = os.path.dirname(SCRIPT_DIR)
+if PI_DIR not in sys.path:
+    sys.path.insert(0, PI_DIR)
+
+from trajectory import merge_steps, profile
+
+SPEED = 0.5
+ACCEL = 0.5
+JERK = 2.0
+MIN_SCALE = 0.15
+DT = 0.05
+EPS = 1e-9
+
+
+def motions(route):
+    # (distance, angle, steps) per merged motion
+    return [(m["distance"], m["angle"], m["steps"]) for m in merge_steps(route, SPEED)]
+
+
+MERGE_CASES = [
+    ("same sign distances merge", [{"distance": 0.5}, {"distance": 0.3}], [(0.8, None, 2)]),
+    ("same sign angles merge", [{"angle": -45}, {"angle": -45}], [(None, -90, 2)]),
+    ("opposite sign distances stay apart", [{"distance": 0.5}, {"distance": -0.5}],
+     [(0.5, None, 1), (-0.5, None, 1)]),
+    ("opposite sign angles stay apart", [{"angle": 90}, {"angle": -90}], [(None, 90, 1), (None, -90, 1)]),
+    ("different speeds stay apart", [{"distance": 0.5}, {"distance": 0.5, "left_speed": 0.2, "right_speed": 0.2}],
+     [(0.5, None, 1), (0.5, None, 1)]),
+    ("distance and angle split", [{"distance": 0.5, "angle": 90}, {"angle": 90}],
+     [(0.5, None, 0), (None, 180, 2)]),
+    ("zero length parts left out", [{"distance": 0.5, "angle": 0}, {"distance": 0}, {"distance": 0.3}],
+     [(0.8, None, 3)]),
+    ("leading zero step counts with the first motion", [{"distance": 0, "angle": 0}, {"angle": 30}],
+     [(None, 30, 2)]),
+    ("zero only route has no motion", [{"distance": 0}, {"angle": 0}], []),
+]
+
+
+def check_merge(failures):
+    for name, route, expected in MERGE_CASES:
+        result = motions(route)
+        if result != expected:
+            failures.append(f"merge_steps {name}: {result}, expected {expected}")
+
+
+def run_profile(target, initial_speed=0.0, limit=2000):
+    # Drive a profile on its own commanded speed until the target is reached. Returns the commanded wheel speeds
+    # and the accelerations of the profile per update.
+    ramp = profile(target, SPEED, 1.0, ACCEL, JERK, MIN_SCALE, initial_speed)
+    progress = 0.0
+    speeds, accelerations = [], []
+    while progress < target and len(speeds) < limit:
+        speed = ramp.update(progress, DT) * SPEED
+        speeds.append(speed)
+        accelerations.append(ramp.acceleration)
+        progress += speed * DT
+    return speeds, accelerations
+
+
+def check_profile(failures):
+    for target in (0.05, 1.0, 3.0):
+        speeds, accelerations = run_profile(target)
+        name = f"profile to {target} m"
+        if len(speeds) >= 2000:
+            failures.append(f"{name}: target not reached")
+        if min(speeds) < MIN_SCALE * SPEED - EPS:
+            failures.append(f"{name}: speed {min(speeds):.3f} below min_scale")
+        if max(speeds) > SPEED + EPS:
+            failures.append(f"{name}: speed {max(speeds):.3f} above the wheel speed")
+        # the min_scale floor is a command on top of the profile, the limits apply to the profile itself
+        for previous, current in zip(accelerations, accelerations[1:]):
+            if abs(current) > ACCEL + EPS:
+                failures.append(f"{name}: acceleration {current:.3f} above {ACCEL}")
+                break
+            if abs(current - previous) > JERK * DT + EPS:
+                failures.append(f"{name}: jerk {(current - previous) / DT:.3f} above {JERK}")
+                break
+        raised = [b - a for a, b in zip(speeds, speeds[1:]) if b > a]
+        if raised and max(raised) > ACCEL * DT + EPS:
+            failures.append(f"{name}: speed step {max(raised):.3f} above accel x dt")
+
+    # a preempting route ramps on from the current speed instead of dropping to min_scale
+    speeds, _ = run_profile(2.0, initial_speed=0.4)
+    if abs(speeds[0] - 0.4) > ACCEL * DT + EPS:
+        failures.append(f"profile from 0.4 m/s starts at {speeds[0]:.3f}")
+
+
+def main() -> int:
+    failures = []
+    check_merge(failures)
+    check_profile(failures)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        return 1
+    print(f"PASS: {len(MERGE_CASES)} merge cases and speed profile limits")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
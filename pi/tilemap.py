@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""  o R o v e r  Object Recognition and Versatile Exploration Robot
+     License      MIT License, Copyright (C) 2026 C v Kruijsdijk & P. Zengers
+     Description  sparse tiled log-odds occupancy map for the boss server
+"""
+
+import os
+import base64
+from collections import OrderedDict
+import numpy as np
+
+
+def probability(cells):
+    # Occupancy probability 0..1 of a log-odds array
+    return 1.0 - 1.0 / (1.0 + np.exp(cells))
+
+
+def encode_tile(tile):
+    # Quantize a log-odds tile to uint8 probabilities (0 free, 127 unknown, 254 occupied) and run-length encode it
+    # row by row as (count, value) byte pairs with count 1..255. Returns the pairs as base64 text.
+    values = np.rint(probability(tile.astype(np.float64)).ravel() * 254).astype(np.uint8)
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    lengths = np.diff(np.r_[starts, len(values)])
+    # split runs longer than 255 into full chunks plus the remainder
+    chunks = (lengths + 254) // 255
+    run = np.repeat(np.arange(len(lengths)), chunks)
+    first = np.repeat(np.cumsum(chunks) - chunks, chunks)
+    last = np.arange(len(run)) - first == chunks[run] - 1
+    counts = np.where(last, lengths[run] - 255 * (chunks[run] - 1), 255)
+    pairs = np.empty((len(run), 2), dtype=np.uint8)
+    pairs[:, 0] = counts
+    pairs[:, 1] = values[starts[run]]
+    return base64.b64encode(pairs.tobytes()).decode("ascii")
+
+
+def decode_tile(text, tile_size):
+    # Inverse of encode_tile: tile_size x tile_size uint8 array indexed [y, x]
+    pairs = np.frombuffer(base64.b64decode(text), dtype=np.uint8).reshape(-1, 2)
+    return np.repeat(pairs[:, 1], pairs[:, 0]).reshape(tile_size, tile_size)
+
+
+class tilemap:
+    """ Unbounded occupancy map stored as float32 log-odds in square tiles of tile_size cells. Tiles are allocated
+        when a sensor beam first touches them and kept in least recently used order; above max_tiles the oldest
+        tile is written to spill_dir (when set, and read back on the next access) or dropped. Cell (0, 0) holds
+        the world origin, cell coordinates are round(metres / resolution_m) and may be negative.
+        Every reading adds log_odds_free to the cells a beam passed and log_odds_occupied to the cells it ended in,
+        clamped to [log_odds_min, log_odds_max] so the map can still change its mind. 0 means unknown.
+    """
+    def __init__(self, resolution_m, tile_size=64, max_tiles=256, spill_dir=None,
+                 log_odds_occupied=0.85, log_odds_free=-0.4, log_odds_min=-2.0, log_odds_max=3.5):
+        self.resolution_m = resolution_m
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.spill_dir = spill_dir or None
+        self.log_odds_occupied = np.float32(log_odds_occupied)
+        self.log_odds_free = np.float32(log_odds_free)
+        self.log_odds_min = np.float32(log_odds_min)
+        self.log_odds_max = np.float32(log_odds_max)
+        self.tiles = OrderedDict() # (tx, ty) -> tile_size x tile_size array indexed [y, x]
+        self.spilled = set() # tile keys stored in spill_dir
+        self.dirty = set() # tile keys changed since the last take_dirty
+        self.updates = 0
+        self.evicted = 0
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, f"tile_{key[0]}_{key[1]}.npy")
+
+    def tile(self, key, create=False):
+        # Tile for key (tx, ty), read back from spill_dir when it was spilled. Without create an unknown tile
+        # returns None.
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        if key in self.spilled:
+            path = self._spill_path(key)
+            tile = np.load(path)
+            os.remove(path)
+            self.spilled.discard(key)
+        elif create:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=np.float32)
+        else:
+            return None
+        self.tiles[key] = tile
+        self._evict()
+        return tile
+
+    def _evict(self):
+        while len(self.tiles) > self.max_tiles > 0:
+            key, tile = self.tiles.popitem(last=False)
+            if self.spill_dir:
+                np.save(self._spill_path(key), tile)
+                self.spilled.add(key)
+            self.evicted += 1
+
+    def apply(self, free, hit):
+        # Add the (cx, cy, count) cells of raycast.cast: count times log_odds_free for cells a beam passed and count
+        # times log_odds_occupied for cells a beam ended in
+        self._add(free, self.log_odds_free)
+        self._add(hit, self.log_odds_occupied)
+        self.updates += 1
+
+    def _add(self, cells, value):
+        cx, cy, counts = cells
+        if len(cx) == 0:
+            return
+        tx, ty = cx // self.tile_size, cy // self.tile_size
+        lx, ly = cx - tx * self.tile_size, cy - ty * self.tile_size
+        delta = counts.astype(np.float32) * value
+        # group the cells per tile: one slice of the sorted arrays per touched tile
+        keys, inverse = np.unique(np.stack((tx, ty)), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=keys.shape[1]))
+        start = 0
+        for index, end in enumerate(bounds):
+            sel = order[start:end]
+            start = end
+            key = (int(keys[0, index]), int(keys[1, index]))
+            tile = self.tile(key, create=True)
+            self.dirty.add(key)
+            # cells are unique, so fancy indexing updates each one once
+            values = tile[ly[sel], lx[sel]] + delta[sel]
+            np.clip(values, self.log_odds_min, self.log_odds_max, out=values)
+            tile[ly[sel], lx[sel]] = values
+
+    def take_dirty(self):
+        # Keys of the tiles changed since the previous call
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def peek(self, key):
+        # Tile for key (tx, ty) without changing the map: a spilled tile is read from spill_dir but not cached, and
+        # the LRU order stays as it is. Unknown tiles return None.
+        tile = self.tiles.get(key)
+        if tile is None and key in self.spilled:
+            tile = np.load(self._spill_path(key))
+        return tile
+
+    def keys(self):
+        # Keys of all stored tiles, in memory and spilled
+        return set(self.tiles) | self.spilled
+
+    def encode(self, keys):
+        # Published form of the given tiles, see encode_tile. Read-only, tiles dropped by eviction are left out.
+        tiles = []
+        for key in sorted(keys):
+            tile = self.peek(key)
+            if tile is not None:
+                tiles.append({"tx": key[0], "ty": key[1], "rle": encode_tile(tile)})
+        return tiles
+
+    def stats(self):
+        return {"tiles": len(self.tiles), "spilled": len(self.spilled), "evicted": self.evicted,
+                "bytes": len(self.tiles) * self.tile_size * self.tile_size * 4}
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""  o R o v e r  Object Recognition and Versatile Exploration Robot
+     License      MIT License, Copyright (C) 2026 C v Kruijsdijk & P. Zengers
+     Description  trajectory generation for ugv.py: merging of route steps and acceleration/jerk limited speed profiles
+"""
+
+import math
+
+
+def merge_steps(route, default_speed):
+    # Turn a route into the list of motions that ugv.py executes. A step with both distance and angle is split into
+    # a straight part followed by an in-place rotation (the order _move_segment uses). Consecutive straight parts or
+    # consecutive rotations with the same wheel speeds and the same direction are merged into one motion by adding
+    # their distance or angle, so the rover does not stop between them. Zero length parts are left out. Each motion
+    # records in "steps" how many route steps end in it; a step without any motion ends in the previous motion (or
+    # the next one at the start of the route), a route without any motion gives no motions.
+    motions = []
+    pending = 0 # steps without motion before the first motion
+    for step in route:
+        left = step.get("left_speed", default_speed)
+        right = step.get("right_speed", default_speed)
+        distance, angle = step.get("distance"), step.get("angle")
+        parts = [(kind, value) for kind, value in (("distance", distance), ("angle", angle)) if value is not None]
+        if not parts:
+            motions.append({"left_speed": left, "right_speed": right, "distance": None, "angle": None,
+                            "steps": 1 + pending})
+            pending = 0
+            continue
+        parts = [(kind, value) for kind, value in parts if value != 0]
+        if not parts:
+            if motions:
+                motions[-1]["steps"] += 1
+            else:
+                pending += 1
+            continue
+        for index, (kind, value) in enumerate(parts):
+            ends_step = 1 if index == len(parts) - 1 else 0
+            other = "angle" if kind == "distance" else "distance"
+            last = motions[-1] if motions else None
+            if (last is not None and last[kind] is not None and last[other] is None
+                    and (last[kind] > 0) == (value > 0)
+                    and last["left_speed"] == left and last["right_speed"] == right):
+                last[kind] += value
+                last["steps"] += ends_step
+            else:
+                motion = {"left_speed": left, "right_speed": right, "distance": None, "angle": None,
+                          "steps": ends_step + pending}
+                motion[kind] = value
+                motions.append(motion)
+                pending = 0
+    return motions
+
+
+class profile:
+    """ Speed profile for one motion, expressed as a scale factor (0..1) on the commanded wheel speeds. The wheel
+        acceleration is limited to accel (m/s^2) and its rate of change to jerk (m/s^3); towards the end the speed
+        follows a braking curve on the remaining wheel travel, so the motion ends slowly instead of with a hard stop.
+        The scale never drops below min_scale, to keep the rover moving until the target is measured. initial_speed
+        (m/s) is the wheel speed the motion starts from, e.g. of a route it preempts, so the profile ramps from there.
+    """
+    def __init__(self, target, wheel_speed, wheel_per_unit, accel, jerk, min_scale=0.1, initial_speed=0.0):
+        self.target = target # motion length in progress units (m or deg), None for an open end
+        self.wheel_speed = abs(wheel_speed) # full speed of the fastest wheel, m/s
+        self.wheel_per_unit = wheel_per_unit # wheel travel (m) per progress unit
+        self.accel = accel
+        self.jerk = jerk
+        self.min_scale = min_scale
+        self.speed = min(abs(initial_speed), self.wheel_speed) # current wheel speed, m/s
+        self.acceleration = 0.0 # current wheel acceleration, m/s^2
+        self.enabled = accel > 0 and self.wheel_speed > 0
+
+    def ramp_time(self):
+        # Time the profile adds compared to driving at full speed, used to extend timeouts
+        if not self.enabled:
+            return 0.0
+        return self.wheel_speed / self.accel + (self.accel / self.jerk if self.jerk > 0 else 0.0)
+
+    def braking_speed(self, remaining):
+        # Highest wheel speed from which the rover can still stop within remaining wheel travel (m).
+        # Solves v^2/(2a) + v*a/(2j) = remaining; the second term is the extra distance of the jerk limited ramp.
+        a = self.accel
+        lag = a / (2.0 * self.jerk) if self.jerk > 0 else 0.0
+        return a * (math.sqrt(lag * lag + 2.0 * remaining / a) - lag)
+
+    def update(self, progress, dt):
+        # Advance the profile by dt seconds at the given progress and return the speed scale to command
+        if not self.enabled:
+            return 1.0
+        desired = self.wheel_speed
+        if self.target is not None:
+            # the command holds until the next update, so brake for the travel remaining after that update
+            remaining = max(max(self.target - progress, 0.0) * self.wheel_per_unit - self.speed * dt, 0.0)
+            desired = min(desired, self.braking_speed(remaining))
+        if dt <= 0:
+            return max(self.speed / self.wheel_speed, self.min_scale)
+        wanted = max(-self.accel, min(self.accel, (desired - self.speed) / dt))
+        if self.jerk > 0:
+            step = self.jerk * dt
+            wanted = max(self.acceleration - step, min(self.acceleration + step, wanted))
+        self.acceleration = wanted
+        self.speed = max(0.0, min(self.wheel_speed, self.speed + self.acceleration * dt))
+        return max(self.speed / self.wheel_speed, self.min_scale)
@@ -6,12 +6,16 @@
      Description  interface for UGV control (motor commands etc)
 """
 import oroverlib as orover
+import trajectory
 from base_process import baseprocess
 import serial
 import time
 import zmq
 import json
 import threading
+import collections
+import logging
+import math
 
 
 class handler:
@@ -21,7 +25,7 @@ class handler:
         like logging or sending new messages to the bus.
     """
     def __init__(self):
-        self.ismoving = False # Checks if robot is currently moving, to prevent sending multiple movement commands at the same time. 
+        self.ismoving = False # True while the motion executor runs a route
     
     def _route_check(self, route):
         # Check if route is valid, meaning it is a list of segments with valid distance and angle parameters. 
@@ -41,38 +45,35 @@ class handler:
                 return False
         return True
 
-    def _start_motion(self, *args, **kwargs):
-        self.ismoving = True
-        ugv._stop_event.clear() # CvK Clear stop event before starting motion
-
-        self.mv_thread = threading.Thread(target=ugv.move_rover_thread, args=args, kwargs=kwargs, daemon=True)
-        self.mv_thread.start()
+    def _queue_mode(self, body, default):
+        # Queue mode from the message body: append (after the queued routes), replace (preempt now) or clear
+        mode = body.get("mode", default)
+        if mode not in ("append", "replace", "clear"):
+            b.logger.warning(f"Unknown route mode {mode}, using {default}")
+            mode = default
+        return mode
 
     def cmd_move(self,message):
         # Handle move command, expects body to contain "left_speed" and "right_speed" parameters, 
         # which are the speeds for the left and right wheels in m/s. This action will nog stop until 
-        # a stop command is received, or another move command is received while already moving. 
+        # a stop command is received, or another move command is received. 
         # 
         # A move is a route with one segment with the given speeds, and no distance or angle limit. 
-        # The robot should keep sending motor commands
-        route = None
-        if self.ismoving:
-            b.logger.warning("cmd_move ignored: robot is already moving")
-            return False
+        # The robot should keep sending motor commands. By default it replaces the current motion.
         body = message.get('body') or {}
         if "left_speed" not in body:
-            b.logger.warning(f"cmd_move received without left_speed parameter in body, defaulting to 0")
-            left_speed = self.linear_speed
+            b.logger.warning(f"cmd_move received without left_speed parameter in body, defaulting to {ugv.linear_speed}")
+            left_speed = ugv.linear_speed
         else:
             left_speed = body.get('left_speed')
         if "right_speed" not in body:
-            b.logger.warning(f"cmd_move received without right_speed parameter in body, defaulting to 0")
-            right_speed = self.linear_speed
+            b.logger.warning(f"cmd_move received without right_speed parameter in body, defaulting to {ugv.linear_speed}")
+            right_speed = ugv.linear_speed
         else:
             right_speed = body.get('right_speed')  
         route = [{"left_speed": left_speed, "right_speed": right_speed, "distance": None, "angle": None}]
-        b.logger.debug(f"cmd_move starting motion with route {route}")
-        self._start_motion(route)
+        b.logger.debug(f"cmd_move queueing motion with route {route}")
+        ugv.queue_route(body.get("id", message.get("id")), route, self._queue_mode(body, "replace"))
 
     def cmd_moveTo(self,message):
         # Handle moveTo command, expects body to contain "distance" and "angle" parameters, which are the distance in meters 
@@ -80,10 +81,6 @@ class handler:
         # and durations to achieve the desired movement, and send the appropriate motor commands to the serial port. 
         # 
         # A moveTo is a route with one segment with the given distance and angle, and default speeds. 
-        route = None
-        if self.ismoving:
-            b.logger.warning("cmd_moveTo ignored: robot is already moving")
-            return False
         body = message.get('body') or {}
 
         # check for distance and angle parameters in body, and use default values if not provided
@@ -100,14 +97,13 @@ class handler:
             angle = body.get('angle')
 
         route = [{"distance": distance, "angle": angle}]
-        b.logger.debug(f"cmd_moveTo starting motion with route {route}")
-        self._start_motion(route)
+        b.logger.debug(f"cmd_moveTo queueing motion with route {route}")
+        ugv.queue_route(body.get("id", message.get("id")), route, self._queue_mode(body, "append"))
 
     def cmd_moveRoute(self, message):
         # Handle route command, expects body to contain a route list with distance/angle steps.
-        if self.ismoving:
-            b.logger.warning("cmd_moveRoute ignored: robot is already moving")
-            return False
+        # body "mode": append (default) queues the route, replace preempts the current motion, clear stops and
+        # empties the queue (no route needed)
         body = message.get('body') or {}
         if "id" not in body:
             b.logger.warning(f"cmd_moveRoute received without id parameter in body, defaulting to unknown")
@@ -115,6 +111,11 @@ class handler:
         else:
             route_id = body.get("id")
 
+        mode = self._queue_mode(body, "append")
+        if mode == "clear":
+            ugv.queue_route(route_id, None, mode)
+            return True
+
         route = body.get("route") or []
         if not isinstance(route, list) or not route:
             b.logger.warning(f"cmd_moveRoute ignored: route {route_id} has invalid or empty route in message {message.get('id')}")
@@ -123,8 +124,8 @@ class handler:
             b.logger.warning(f"cmd_moveRoute ignored: route {route_id} contains invalid steps in message {message.get('id')}")
             return False
         
-        b.logger.debug(f"cmd_moveRoute id {route_id} starting motion with route {route}")
-        self._start_motion(route)
+        b.logger.debug(f"cmd_moveRoute id {route_id} queueing motion ({mode}) with route {route}")
+        ugv.queue_route(route_id, route, mode)
 
 #    def event_obstacleDetected(self, message):
 #        # Handle obstacle detected event, expects body to contain "distance" and "angle" parameters, which are the distance 
@@ -164,11 +165,15 @@ class handler:
             b.logger.warning(f"Message {message['id']} received without left_speed or right_speed parameter in body")
             return False
         # body={"left_speed": left_speed, "right_speed": right_speed})
-        s = json.dumps({"T":1,"L":body.get("left_speed"),"R":body.get("right_speed")})
+        try:
+            left_speed, right_speed = float(body.get("left_speed")), float(body.get("right_speed"))
+        except (TypeError, ValueError):
+            b.logger.warning(f"Message {message['id']} has non-numeric left_speed or right_speed in body")
+            return False
         # set this speed as default for move and moveTo commands, until another speed command is received
         # ugv.linear_speed = body.get("left_speed")
         # ugv.angular_speed = body.get("right_speed")
-        ugv.write_serial(s)
+        ugv._write(left_speed, right_speed) # through the motor frame cache, so it knows the last command
 
     def cmd_stop(self, message): # CvK Stop if threading is activated to stop
         b.logger.info("Stop command received")
@@ -181,15 +186,176 @@ class handler:
         distance = body.get("distance")
         sensor_angle = body.get("sensor_angle")
 
+        if isinstance(sensor_angle, (int, float)) and sensor_angle > -25 and sensor_angle < 25: # CvK hardcoded to see if it works
+            self._safety_stop(message) # stop first, log afterwards
+            b.logger.info(f"Obstacle detected angle between -25 and 25 {sensor_angle} deg")
+
         b.logger.warning(f"Event_object_detected - Obstacle detected at distance {distance} m, sensor angle {sensor_angle} ")
+        return True
 
-        if sensor_angle > -25 and sensor_angle < 25: # CvK hardcoded to see if it works
-            b.logger.info(f"Obstacle detected angle between -25 and 25 {sensor_angle} deg")
-            ugv._stop_event.set() # CvK event detected so STOP
-            ugv._stop() # CvK Stopugv._stop()
+    def event_emergencyStop(self, message):
+        self._safety_stop(message)
+        b.logger.warning(f"Emergency stop received from {message.get('me')}")
+        return True
 
+    def event_collisionDetected(self, message):
+        self._safety_stop(message)
+        b.logger.warning(f"Collision detected by {b.enum_to_name(message.get('src'))}")
         return True
 
+    def _safety_stop(self, message):
+        # Stop the motors, then record the latency from the sensor read ("read_ns" in body) to the serial stop write
+        ugv._stop() # CvK event detected so STOP
+        read_ns = (message.get("body") or {}).get("read_ns")
+        if isinstance(read_ns, int):
+            ugv.record_stop_latency((time.time_ns() - read_ns) / 1e6)
+
+# ESP feedback types from firmware esp/include/json_cmd.h, mapped to bus messages. Each T code has one or more
+# routes: src and reason of the bus message, "fields" maps body field -> serial key, "static" adds fixed body
+# fields, "sample" publishes via publish_sample and "filter" names a ugv method that may change or drop the body.
+# Routes marked "telemetry" pass the deadband/max-silence filter first (see telemetryfilter). An optional "hook"
+# names a ugv method that receives every frame of that type before filtering, e.g. for odometry.
+# A new firmware feedback type only needs an entry here.
+SERIAL_FEEDBACK = {
+    1001: {"name": "base_feedback", "hook": "_update_odometry", "routes": [
+        {"src": orover.origin.sensor_battery, "reason": orover.state.battery,
+         "fields": {"voltage": "v"}, "filter": "_battery_update", "telemetry": True},
+        {"src": orover.origin.sensor_imu, "reason": orover.state.motion, "sample": True, "telemetry": True,
+         "fields": {"heading": "r", "roll": "y", "left_speed": "L", "right_speed": "R", "pitch": "p", "temperature": "temp"}},
+    ]},
+    1002: {"name": "imu_feedback", "hook": "_update_odometry", "routes": [
+        {"src": orover.origin.sensor_imu, "reason": orover.state.motion, "sample": True, "telemetry": True,
+         "fields": {"heading": "r", "roll": "y", "pitch": "p", "ax": "ax", "ay": "ay", "az": "az",
+                    "gx": "gx", "gy": "gy", "gz": "gz", "mx": "mx", "my": "my", "mz": "mz", "temperature": "temp"}},
+    ]},
+    1003: {"name": "esp_now_recv", "routes": [
+        {"src": orover.origin.orover_ugv, "reason": orover.state.sensor_status,
+         "static": {"channel": "esp_now_recv"}, "fields": {"mac": "mac", "message": "megs"}},
+    ]},
+    1004: {"name": "esp_now_send_status", "routes": [
+        {"src": orover.origin.orover_ugv, "reason": orover.state.sensor_status,
+         "static": {"channel": "esp_now_send"}, "fields": {"mac": "mac", "status": "status", "message": "megs"}},
+    ]},
+    1005: {"name": "servo_bus_status", "routes": [
+        {"src": orover.origin.orover_ugv, "reason": orover.state.sensor_status,
+         "static": {"channel": "servo_bus"}, "fields": {"id": "id", "status": "status"}},
+    ]},
+    1051: {"name": "roarm_feedback", "routes": [
+        {"src": orover.origin.orover_ugv, "reason": orover.state.pose,
+         "fields": {"x": "x", "y": "y", "z": "z", "b": "b", "s": "s", "e": "e", "t": "t",
+                    "torB": "torB", "torS": "torS", "torE": "torE", "torH": "torH"}},
+    ]},
+    139: {"name": "speed_rate_feedback", "routes": [
+        {"src": orover.origin.orover_ugv, "reason": orover.state.actuator_speed, "telemetry": True,
+         "fields": {"left_rate": "L", "right_rate": "R"}},
+    ]},
+}
+
+
+_FRAME_WHITESPACE = frozenset(b" \t\r\n\x0b\x0c") # bytes.strip() whitespace
+
+
+class lineframer:
+    """ Splits the serial byte stream into newline delimited frames. All data stays in one bytearray: complete frames
+        are located with find() offsets and the consumed part is removed once per chunk instead of once per line.
+        A partial frame longer than max_frame_length is discarded up to the next newline, so a garbage stream
+        cannot grow the buffer without limit.
+    """
+    def __init__(self, max_frame_length=4096):
+        self.max_frame_length = max_frame_length
+        self.buffer = bytearray()
+        self.discarding = False # True while skipping the rest of an oversized frame
+        self.frames = 0
+        self.oversized = 0
+
+    def feed(self, data):
+        # Add a chunk of serial data, return the complete non-empty frames as bytes (without line endings).
+        # Frames are sliced from a memoryview of the buffer, so the bytes() at hand-off is the only copy; the view
+        # is released before the buffer is compacted, a bytearray cannot be resized while it is exported.
+        buf = self.buffer
+        buf += data
+        frames = []
+        start = 0
+        end = buf.find(b"\n")
+        if self.discarding and end >= 0:
+            self.discarding = False
+            start = end + 1
+            end = buf.find(b"\n", start)
+        with memoryview(buf) as view:
+            while end >= 0 and not self.discarding:
+                if end - start > self.max_frame_length:
+                    self.oversized += 1
+                else:
+                    first, last = start, end
+                    while first < last and buf[first] in _FRAME_WHITESPACE:
+                        first += 1
+                    while last > first and buf[last - 1] in _FRAME_WHITESPACE:
+                        last -= 1
+                    if first < last:
+                        frames.append(bytes(view[first:last]))
+                start = end + 1
+                end = buf.find(b"\n", start)
+        if self.discarding:
+            start = len(buf) # still inside an oversized frame, drop everything
+        if start:
+            del buf[:start]
+        if len(buf) > self.max_frame_length:
+            self.oversized += 1
+            self.discarding = True
+            buf.clear()
+        self.frames += len(frames)
+        return frames
+
+
+class telemetryfilter:
+    """ Change detection for telemetry routes. A body is published when one of its deadband fields moved more than
+        its deadband since the last published body of the same route, or when the route was silent for max_silence
+        seconds. Fields without a deadband do not trigger a publish. An empty deadband disables the filter.
+    """
+    def __init__(self, deadband, max_silence):
+        self.deadband = deadband # field -> minimum change
+        self.max_silence = max_silence
+        self.last = {} # route key -> (monotonic time, last published body)
+        self.suppressed = collections.Counter() # route name -> suppressed frames
+
+    @staticmethod
+    def parse_deadband(text):
+        # Parse "field:value, field:value" into a dict, skipping invalid entries
+        deadband = {}
+        for item in text.split(","):
+            field, _, value = item.partition(":")
+            try:
+                deadband[field.strip()] = abs(float(value))
+            except ValueError:
+                if item.strip():
+                    b.logger.error(f"Ignoring invalid telemetry_deadband entry '{item.strip()}'")
+        return deadband
+
+    def changed(self, key, name, body, now=None):
+        # Return True when the body should be published and remember it as the last published body
+        if not self.deadband:
+            return True
+        now = time.monotonic() if now is None else now
+        last = self.last.get(key)
+        if last is None or now - last[0] >= self.max_silence or self._exceeds(last[1], body):
+            self.last[key] = (now, body)
+            return True
+        self.suppressed[name] += 1
+        return False
+
+    def _exceeds(self, old, new):
+        for field, band in self.deadband.items():
+            if field not in new:
+                continue
+            before, after = old.get(field), new[field]
+            if isinstance(before, (int, float)) and isinstance(after, (int, float)):
+                if abs(after - before) > band:
+                    return True
+            elif before != after:
+                return True
+        return False
+
+
 class ugv:
     """ Handler class for UGV messages, received via serial port. The handler functions parse the incoming serial data, 
         extract relevant information, and send new messages to the bus based on the content of the serial data. 
@@ -198,10 +364,20 @@ class ugv:
         self.linear_speed = b.config.getfloat("ugv", "linear_speed", fallback=0.5) # Default linear speed in m/s
         self.angular_speed = b.config.getfloat("ugv", "angular_speed", fallback=90.0) # Default angular speed in degrees/s
         self.cmd_period = b.config.getfloat("ugv", "cmd_period", fallback=0.1) # Default command period in seconds
-        self._stop_event = threading.Event()  # CvK Stop event in case of f.e. object_detected
+        self._stop_event = threading.Event()  # CvK Stop event in case of f.e. object_detected, also set to preempt a route
+        self._routes = collections.deque() # queued (route id, route) for the motion executor
+        self._route_cond = threading.Condition()
+        self._active_route = None # id of the route being executed
+        self._abort_cause = None # why the active route was aborted: stopped, preempted or cleared
         self.ugv_updates_interval = b.config.getint("ugv", "ugv_updates_interval", fallback=1) 
         self.ugv_updates_enabled = b.config.getboolean("ugv", "ugv_updates_enabled", fallback=False)    
-        self._serial_rx_buffer = ""
+        self.framer = lineframer(b.config.getint("serial", "max_frame_length", fallback=4096))
+        self.serial_queue_size = b.config.getint("serial", "queue_size", fallback=256) # frames buffered between reader and parser
+        self.serial_stats_interval = b.config.getfloat("serial", "stats_interval", fallback=10.0) # 0 disables the datarate event
+        self._serial_frames = collections.deque() # ring buffer from the reader thread to the parser thread
+        self._serial_cond = threading.Condition()
+        self.serial_stats = {"bytes_read": 0, "frames_parsed": 0, "frames_dropped": 0, "parse_errors": 0, "max_queue_depth": 0}
+        self.stop_latency = {"count": 0, "last_ms": None, "max_ms": 0.0, "total_ms": 0.0} # sensor read -> stop write
         self.voltage = 12.0 # Dummy voltage value until we receive real data from the UGV firmware, to prevent None values in the UI and logs before the first battery message is received.
 
         # Stores the current route to follow for moveTo commands, which can be used to implement obstacle avoidance or dynamic path replanning in the future.
@@ -213,25 +389,46 @@ class ugv:
             self.update_thread = threading.Thread(target=self._update_loop, daemon=True)
             self.update_thread.start() 
 
-        # ESP feedback type map from firmware json_cmd.h.
-        self._serial_type_name = {
-            1001: "base_feedback",
-            1002: "imu_feedback",
-            1003: "esp_now_recv",
-            1004: "esp_now_send_status",
-            1005: "servo_bus_status",
-            1051: "roarm_feedback",
-            139: "speed_rate_feedback",
-        }
+        self.telemetry = telemetryfilter(
+            telemetryfilter.parse_deadband(b.config.get("ugv", "telemetry_deadband",
+                fallback="heading:1.0, roll:1.0, pitch:1.0, left_speed:0.01, right_speed:0.01, voltage:0.02, temperature:0.5, left_rate:0.01, right_rate:0.01")),
+            b.config.getfloat("ugv", "telemetry_max_silence", fallback=5.0))
+        self._serial_dispatch = self.compile_serial_feedback(SERIAL_FEEDBACK)
+
+        # Closed-loop segment execution, based on wheel speed (T=1001 L/R) and IMU heading feedback
+        self.closed_loop = b.config.getboolean("ugv", "closed_loop", fallback=True)
+        self.feedback_timeout = b.config.getfloat("ugv", "feedback_timeout", fallback=0.5) # s; older feedback means open-loop
+        self.odometry_max_gap = b.config.getfloat("ugv", "odometry_max_gap", fallback=2.0) # s; wheel speeds are held this long
+        self.segment_timeout_factor = b.config.getfloat("ugv", "segment_timeout_factor", fallback=2.0) # x open-loop duration
+        self.wheel_base = b.config.getfloat("ugv", "wheel_base", fallback=0.172) # m between the wheel tracks
+        # Serial writes: encoded motor frames per quantized speed pair, and skipping of identical repeats
+        self.resend_interval = b.config.getfloat("ugv", "resend_interval", fallback=1.0) # s; must stay below the firmware heartbeat
+        self._motor_frames = {}
+        self._last_motor_frame = None
+        self._last_motor_write = 0.0
+        self._last_wheels = (0.0, 0.0) # last commanded (left, right) speed, the start of the next speed profile
+        self._write_lock = threading.Lock()
+        self.write_stats = {"frames": 0, "skipped": 0, "bytes": 0, "total_ms": 0.0, "max_ms": 0.0}
+        # Trajectory: merging of route steps and acceleration/jerk limited wheel speed profiles
+        self.merge_steps = b.config.getboolean("ugv", "merge_steps", fallback=True)
+        self.max_accel = b.config.getfloat("ugv", "max_accel", fallback=0.5) # m/s^2 per wheel, 0 disables the profile
+        self.max_jerk = b.config.getfloat("ugv", "max_jerk", fallback=2.0) # m/s^3, 0 only limits the acceleration
+        self.min_speed_ratio = b.config.getfloat("ugv", "min_speed_ratio", fallback=0.15) # lowest profile speed
+        # Integrated odometry, written by the serial parser thread and read by the motion thread
+        self.odometry = {"distance": 0.0, "wheel_angle": 0.0, "heading": None, "wheel_time": None, "heading_time": None,
+                         "left": 0.0, "right": 0.0, "gaps": 0}
+        self._raw_heading = None
+        self._open_loop_segments = 0 # segments of the running route that (partly) ran open-loop while closed_loop is set
 
     def _update_loop(self):
         # Heartbeat update loop, sending an update event at the configured interval
         time.sleep(10) # Initial delay before starting updates, to allow system to initialize and open serial port
+        tick = b.scheduler("ugv_updates", self.ugv_updates_interval)
         while b.running:
             if self.ugv_updates_enabled:
                 serialmsg = json.dumps({"T":"130"})
                 self.write_serial(serialmsg)   
-            time.sleep(self.ugv_updates_interval)
+            tick.wait()
 
     def open_serial(self):
         # Open the serial port for communication with the UGV, using the configuration parameters from the config file
@@ -241,6 +438,69 @@ class ugv:
         b.logger.info(f"Opening serial port {serial_dev} with baudrate {serial_baud}")
         self.serial_port = serial.Serial(serial_dev, baudrate=serial_baud, timeout=serial_timeout)
 
+    def start_serial_threads(self):
+        # Serial input is read by its own thread, so slow bus handling never leaves the UART buffer undrained
+        self.reader_thread = threading.Thread(target=self._serial_reader_loop, name="serial_reader", daemon=True)
+        self.parser_thread = threading.Thread(target=self._serial_parser_loop, name="serial_parser", daemon=True)
+        self.reader_thread.start()
+        self.parser_thread.start()
+        if self.closed_loop:
+            self.enable_feedback_flow()
+
+    def enable_feedback_flow(self):
+        # The firmware starts with baseFeedbackFlow = 0 and then only answers the T=130 poll, which is far slower
+        # than feedback_timeout. Closed-loop segments need the continuous T=1001 stream.
+        b.logger.info("Enabling continuous base feedback (T=131) for closed-loop segments")
+        self.write_serial(json.dumps({"T": 131, "cmd": 1}))
+
+    def _serial_reader_loop(self):
+        # Drain the serial port into the frame ring buffer. Only framing happens here, parsing is left to the parser thread.
+        while b.running:
+            try:
+                # blocks until at least one byte arrived or the serial timeout expired
+                data = self.serial_port.read(max(1, self.serial_port.in_waiting))
+            except (serial.SerialException, OSError, TypeError) as e:
+                if not b.running:
+                    break # port closed during shutdown
+                b.logger.error(f"Serial read failed: {e}")
+                time.sleep(1)
+                continue
+            if data:
+                self.serial_stats["bytes_read"] += len(data)
+                self.handle_serial_input(data)
+
+    def _serial_parser_loop(self):
+        # Consume frames from the ring buffer, parse and forward them to the bus, and report the datarate periodically
+        next_report = time.monotonic() + self.serial_stats_interval
+        last_report = (time.monotonic(), 0, 0)
+        while b.running:
+            with self._serial_cond:
+                self._serial_cond.wait_for(lambda: self._serial_frames or not b.running, timeout=0.5)
+                frames, self._serial_frames = self._serial_frames, collections.deque()
+            for frame in frames:
+                self._handle_serial_line(frame)
+            if self.serial_stats_interval > 0 and time.monotonic() >= next_report:
+                last_report = self._send_serial_stats(last_report)
+                next_report = time.monotonic() + self.serial_stats_interval
+
+    def _send_serial_stats(self, last_report):
+        # Send the serial counters as state.sensor_datarate, with rates since the previous report
+        now = time.monotonic()
+        stats = dict(self.serial_stats)
+        stats["frames_dropped"] += self.framer.oversized
+        last_time, last_bytes, last_frames = last_report
+        elapsed = max(now - last_time, 1e-6)
+        stats["bytes_per_s"] = round((stats["bytes_read"] - last_bytes) / elapsed, 1)
+        stats["frames_per_s"] = round((stats["frames_parsed"] - last_frames) / elapsed, 1)
+        stats["queue_depth"] = len(self._serial_frames)
+        stats["telemetry_suppressed"] = dict(self.telemetry.suppressed)
+        writes = self.write_stats
+        stats["writes"] = {"frames": writes["frames"], "skipped": writes["skipped"], "bytes": writes["bytes"]
+                          ,"avg_ms": round(writes["total_ms"] / writes["frames"], 3) if writes["frames"] else 0.0
+                          ,"max_ms": round(writes["max_ms"], 3)}
+        b.send_event(src=orover.origin.orover_ugv, reason=orover.state.sensor_datarate, body=stats)
+        return now, stats["bytes_read"], stats["frames_parsed"]
+
     def close_serial(self):
         # Ensure serial port is closed on exit
         if self.serial_port and self.serial_port.is_open:
@@ -248,30 +508,33 @@ class ugv:
             b.logger.info("Serial port closed")
 
     def handle_serial_input(self, data):
-        # ESP serial output is newline-delimited. Buffer chunks to handle partial/multiple frames.
-        try:
-            chunk = data.decode("utf-8", errors="replace")
-        except Exception as e:
-            b.logger.error(f"Serial data decode failed for {data!r}: {e}")
+        # ESP serial output is newline-delimited. The framer buffers chunks to handle partial/multiple frames.
+        # Complete frames go to the ring buffer; when the parser falls behind the oldest frame is dropped.
+        frames = self.framer.feed(data)
+        if not frames:
             return
-
-        self._serial_rx_buffer += chunk
-
-        while "\n" in self._serial_rx_buffer:
-            line, self._serial_rx_buffer = self._serial_rx_buffer.split("\n", 1)
-            line = line.strip()
-            if not line:
-                continue
-            self._handle_serial_line(line)
+        stats = self.serial_stats
+        with self._serial_cond:
+            queue = self._serial_frames
+            for frame in frames:
+                if len(queue) >= self.serial_queue_size:
+                    queue.popleft()
+                    stats["frames_dropped"] += 1
+                queue.append(frame)
+            stats["max_queue_depth"] = max(stats["max_queue_depth"], len(queue))
+            self._serial_cond.notify()
 
     def _handle_serial_line(self, line):
-        # Normalize each serial line into: typed_json / json_untyped / text.
+        # Normalize each serial line (bytes) into: typed_json / json_untyped / text.
         try:
             msg = json.loads(line)
-        except json.JSONDecodeError:
-            b.logger.debug(f"serial_text_received -> {line}")
+        except ValueError: # invalid JSON or invalid UTF-8
+            self.serial_stats["parse_errors"] += 1
+            if b.logger.isEnabledFor(logging.DEBUG):
+                b.logger.debug(f"serial_text_received -> {line.decode('utf-8', errors='replace')}")
             return
 
+        self.serial_stats["frames_parsed"] += 1
         if not isinstance(msg, dict):
             b.logger.debug(f"serial_json_untyped_received -> {msg}")
             return
@@ -281,7 +544,8 @@ class ugv:
             self._handle_typed_serial_message(msg_type, msg)
             return
 
-        b.logger.debug(f"serial_json_untyped_received -> {json.dumps(msg)}")
+        if b.logger.isEnabledFor(logging.DEBUG):
+            b.logger.debug(f"serial_json_untyped_received -> {json.dumps(msg)}")
         self._handle_untyped_serial_message(msg)
 
     def _handle_untyped_serial_message(self, msg):
@@ -301,210 +565,394 @@ class ugv:
         )
 
     def _handle_typed_serial_message(self, msg_type, msg):
-        msg_name = self._serial_type_name.get(msg_type, "unknown_typed_json")
-        b.logger.debug(f"serial_typed_received -> T={msg_type} ({msg_name}) payload={json.dumps(msg)}")
-
-        # Keep dispatch explicit so it is easy to map firmware changes.
-        if msg_type == 1001:
-            b.logger.debug("serial_dispatch -> base feedback - battery and motion status")
-            voltage = round(msg.get("v", self.voltage), 2)
-            # round to 2 decimals to prevent flooding the logs and UI with small voltage changes, 
-            # and only send an update if the voltage has changed significantly since the last update, 
-            # to reduce unnecessary events and updates in the UI.
-            if voltage != self.voltage:
-                self.voltage = voltage
-                b.logger.info(f"Battery voltage updated to {self.voltage} V")
-                b.send_event(
-                    src=orover.origin.sensor_battery,
-                    reason=orover.state.battery,
-                    body={"voltage": self.voltage},
-            )
-            b.send_event(
-                src=orover.origin.sensor_imu,
-                reason=orover.state.motion,
-                body={
-                    "heading": msg.get("r"),
-                    "roll": msg.get("y"),
-                    "left_speed": msg.get("L"),
-                    "right_speed": msg.get("R"),
-                    "pitch": msg.get("p"),
-                    "temperature": msg.get("temp"),
-                },
-            )
-        elif msg_type == 1002:
-            b.logger.debug("serial_dispatch -> imu feedback")
-            b.send_event(
-                src=orover.origin.sensor_imu,
-                reason=orover.state.motion,
-                body={
-                    "heading": msg.get("r"),
-                    "roll": msg.get("y"),
-                    "pitch": msg.get("p"),
-                    "ax": msg.get("ax"),
-                    "ay": msg.get("ay"),
-                    "az": msg.get("az"),
-                    "gx": msg.get("gx"),
-                    "gy": msg.get("gy"),
-                    "gz": msg.get("gz"),
-                    "mx": msg.get("mx"),
-                    "my": msg.get("my"),
-                    "mz": msg.get("mz"),
-                    "temperature": msg.get("temp"),
-                },
-            )
-        elif msg_type == 1003:
-            b.logger.debug("serial_dispatch -> esp-now receive")
-            b.send_event(
-                src=orover.origin.orover_ugv,
-                reason=orover.state.sensor_status,
-                body={
-                    "channel": "esp_now_recv",
-                    "mac": msg.get("mac"),
-                    "message": msg.get("megs"),
-                },
-            )
-        elif msg_type == 1004:
-            b.logger.debug("serial_dispatch -> esp-now send status")
-            b.send_event(
-                src=orover.origin.orover_ugv,
-                reason=orover.state.sensor_status,
-                body={
-                    "channel": "esp_now_send",
-                    "mac": msg.get("mac"),
-                    "status": msg.get("status"),
-                    "message": msg.get("megs"),
-                },
-            )
-        elif msg_type == 1005:
-            b.logger.debug("serial_dispatch -> servo bus status")
-            b.send_event(
-                src=orover.origin.orover_ugv,
-                reason=orover.state.sensor_status,
-                body={
-                    "channel": "servo_bus",
-                    "id": msg.get("id"),
-                    "status": msg.get("status"),
-                },
-            )
-        elif msg_type == 1051:
-            b.logger.debug("serial_dispatch -> roarm feedback")
-            b.send_event(
-                src=orover.origin.orover_ugv,
-                reason=orover.state.pose,
-                body={
-                    "x": msg.get("x"),
-                    "y": msg.get("y"),
-                    "z": msg.get("z"),
-                    "b": msg.get("b"),
-                    "s": msg.get("s"),
-                    "e": msg.get("e"),
-                    "t": msg.get("t"),
-                    "torB": msg.get("torB"),
-                    "torS": msg.get("torS"),
-                    "torE": msg.get("torE"),
-                    "torH": msg.get("torH"),
-                },
-            )
-        elif msg_type == 139:
-            b.logger.debug("serial_dispatch -> speed rate feedback")
-            b.send_event(
-                src=orover.origin.orover_ugv,
-                reason=orover.state.actuator_speed,
-                body={
-                    "left_rate": msg.get("L"),
-                    "right_rate": msg.get("R"),
-                },
-            )
-        else:
-            b.logger.debug(f"serial_dispatch -> unknown typed message T={msg_type}")
+        # Look up the compiled SERIAL_FEEDBACK entry and project the serial fields onto the bus message bodies
+        entry = self._serial_dispatch.get(msg_type)
+        if b.logger.isEnabledFor(logging.DEBUG):
+            msg_name = entry[0] if entry else "unknown_typed_json"
+            b.logger.debug(f"serial_typed_received -> T={msg_type} ({msg_name}) payload={json.dumps(msg)}")
+        if entry is None:
+            return
+
+        if entry[2] is not None:
+            entry[2](msg)
+        for route_key, src, reason, fields, static, as_sample, telemetry, body_filter in entry[1]:
+            body = dict(static)
+            for field, key in fields:
+                body[field] = msg.get(key)
+            if telemetry and not self.telemetry.changed(route_key, entry[0], body):
+                continue
+            if body_filter is not None:
+                body = body_filter(body)
+                if body is None:
+                    continue
+            if as_sample:
+                b.publish_sample(src=src, reason=reason, sample=body)
+            else:
+                b.send_event(src=src, reason=reason, body=body)
+
+    def _update_odometry(self, msg):
+        # Integrate the measured wheel speeds (m/s) into travelled distance and wheel based rotation, and unwrap the
+        # IMU heading (degrees, serial key "r") into a continuous angle. Between frames the previous wheel speeds are
+        # held, for at most odometry_max_gap seconds; a longer gap is counted and its remainder is not integrated.
+        now = time.monotonic()
+        odo = self.odometry
+        left, right = msg.get("L"), msg.get("R")
+        if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+            if odo["wheel_time"] is not None:
+                dt = now - odo["wheel_time"]
+                if dt > self.odometry_max_gap:
+                    odo["gaps"] += 1
+                    dt = self.odometry_max_gap
+                odo["distance"] += (odo["left"] + odo["right"]) / 2.0 * dt
+                if self.wheel_base > 0:
+                    odo["wheel_angle"] += math.degrees((odo["right"] - odo["left"]) / self.wheel_base * dt)
+            odo["left"], odo["right"] = float(left), float(right)
+            odo["wheel_time"] = now
+        heading = msg.get("r")
+        if isinstance(heading, (int, float)):
+            if odo["heading"] is None:
+                odo["heading"] = float(heading)
+            else:
+                odo["heading"] += (heading - self._raw_heading + 180.0) % 360.0 - 180.0
+            self._raw_heading = heading
+            odo["heading_time"] = now
+
+    def _measured(self, key, now):
+        # Odometry value of key at now: distance and wheel_angle are extrapolated from the last T=1001 frame with the
+        # held wheel speeds, like the next frame will integrate them
+        odo = self.odometry
+        value = odo[key]
+        if key in ("distance", "wheel_angle") and odo["wheel_time"] is not None:
+            dt = min(max(now - odo["wheel_time"], 0.0), self.odometry_max_gap)
+            if key == "distance":
+                value += (odo["left"] + odo["right"]) / 2.0 * dt
+            elif self.wheel_base > 0:
+                value += math.degrees((odo["right"] - odo["left"]) / self.wheel_base * dt)
+        return value
+
+    def _feedback_fresh(self, key, now):
+        # True when closed-loop control is enabled and the given odometry source was updated recently
+        last = self.odometry[key]
+        return self.closed_loop and last is not None and now - last <= self.feedback_timeout
+
+    def _rotation(self, now):
+        # Rotated angle source for closed-loop turns: the IMU heading when available, else the wheel speeds
+        if self._feedback_fresh("heading_time", now):
+            return "heading"
+        if self._feedback_fresh("wheel_time", now):
+            return "wheel_angle"
+        return None
+
+    def _battery_update(self, body):
+        # Round to 2 decimals and remember the voltage; the telemetry deadband decides when it is published
+        if body["voltage"] is None:
+            return None
+        self.voltage = round(body["voltage"], 2)
+        b.logger.info(f"Battery voltage updated to {self.voltage} V")
+        return {"voltage": self.voltage}
+
+    def compile_serial_feedback(self, table):
+        # Turn the declarative SERIAL_FEEDBACK table into T -> (name, routes) with field maps as tuples of pairs
+        # and filters resolved to bound methods, so handling a frame is one dict lookup plus a field projection
+        dispatch = {}
+        for msg_type, spec in table.items():
+            routes = []
+            for index, route in enumerate(spec["routes"]):
+                body_filter = route.get("filter")
+                routes.append((
+                    (msg_type, index),
+                    route["src"],
+                    route["reason"],
+                    tuple(route.get("fields", {}).items()),
+                    dict(route.get("static", {})),
+                    route.get("sample", False),
+                    route.get("telemetry", False),
+                    getattr(self, body_filter) if body_filter else None,
+                ))
+            hook = spec.get("hook")
+            dispatch[msg_type] = (spec["name"], tuple(routes), getattr(self, hook) if hook else None)
+        return dispatch
 
     def write_serial(self,serialmsg):
         if self.serial_port and serialmsg:
-            s = f"{serialmsg}\n"
-            b.logger.debug(f"Writing to serial port: {s}")
-            self.serial_port.write(s.encode())
+            if b.logger.isEnabledFor(logging.DEBUG):
+                b.logger.debug(f"Writing to serial port: {serialmsg}")
+            with self._write_lock:
+                # a raw frame may be a motor command, so the next _write must not be skipped as a duplicate
+                self._last_motor_frame = None
+                self._send_frame(serialmsg.encode() + b"\n")
+
+    def _send_frame(self, frame):
+        # All serial writes go through here with _write_lock held by the caller, so there is one writer at a time
+        # and every write is timed
+        start = time.perf_counter()
+        self.serial_port.write(frame)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        stats = self.write_stats
+        stats["frames"] += 1
+        stats["bytes"] += len(frame)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def _profile(self, target, left_speed, right_speed, wheel_per_unit):
+        # Speed profile for one motion with the signed wheel speeds it commands, see trajectory.profile. It starts
+        # from the last commanded wheel speed when both wheels keep their direction (a preempted route or the
+        # previous motion), else from standstill.
+        last_left, last_right = self._last_wheels
+        initial = 0.0
+        if last_left * left_speed >= 0 and last_right * right_speed >= 0:
+            initial = max(abs(last_left), abs(last_right))
+        return trajectory.profile(target, max(abs(left_speed), abs(right_speed)), wheel_per_unit,
+                                  self.max_accel, self.max_jerk, self.min_speed_ratio, initial)
 
     def _move_segment(self, left_speed = 0, right_speed = 0, distance=None, angle=None):
+        # Execute one route step (or merged motion), returns True when it was completed
         b.logger.debug(f"_move_segment called with left_speed={left_speed}, right_speed={right_speed},   angle={angle}, distance={distance}")
     
         if distance is not None:
-            # Drive straight for a calculated duration based on LINEAR_SPEED
+            # Drive straight until the measured distance is reached, open-loop on LINEAR_SPEED without feedback
             direction = 1.0 if distance >= 0 else -1.0
             if self.linear_speed == 0:
                 b.logger.error("Linear speed is set to 0, cannot move for distance")
-                return
-                
-            duration = abs(distance) / self.linear_speed
-            start = time.time()
-            while time.time() - start < duration:
-
-                # CvK Stop
-                if self._stop_event.is_set():
-                    b.logger.info("Movement distance interrupted by stop event")
-                    return
-                
-                b.logger.debug(f"Moving straight for distance {distance} m at speed {self.linear_speed} m/s, duration {duration:.2f} s; time elapsed {time.time() - start:.2f} s")
-                self._write(left_speed * direction, right_speed * direction)
-                time.sleep(self.cmd_period)
-        
+                return False
+            if not self._drive_segment("distance", abs(distance), abs(distance) / self.linear_speed,
+                                       left_speed * direction, right_speed * direction, direction,
+                                       lambda now: "distance" if self._feedback_fresh("wheel_time", now) else None,
+                                       self._profile(abs(distance), left_speed * direction, right_speed * direction, 1.0)):
+                return False
+
         if angle is not None:
-            # Rotate in-place for a calculated duration based on ANGULAR_SPEED
+            # Rotate in-place until the measured angle is reached, open-loop on ANGULAR_SPEED without feedback
             direction = 1.0 if angle >= 0 else -1.0
             if self.angular_speed == 0:
                 b.logger.error("Angular speed is set to 0, cannot rotate for angle")
-                return
-                
-            duration = abs(angle) / self.angular_speed
-            start = time.time()
-            while time.time() - start < duration:
-                # CvK Stop
-                if self._stop_event.is_set():
-                    b.logger.info("Movement angle interrupted by stop event")
-                    return
-                
-                b.logger.debug(f"Rotating in-place for angle {angle} deg at speed {self.angular_speed} deg/s, duration {duration:.2f} s; time elapsed {time.time() - start:.2f} s")
-                self._write(-left_speed * direction, right_speed * direction)
-                time.sleep(self.cmd_period)
-        
+                return False
+            if not self._drive_segment("angle", abs(angle), abs(angle) / self.angular_speed,
+                                       -left_speed * direction, right_speed * direction, direction, self._rotation,
+                                       self._profile(abs(angle), -left_speed * direction, right_speed * direction,
+                                                     math.radians(1.0) * self.wheel_base / 2.0)):
+                return False
+
         if distance is None and angle is None:
             # No distance or angle limit, keep sending the same speed command until another command is received or stop command is received.
             b.logger.debug(f"Moving with left_speed={left_speed} and right_speed={right_speed} indefinitely until next command")
-#  CvK Stop while self.ismoving:
+            tick = b.scheduler("motor_commands", self.cmd_period)
+            ramp = self._profile(None, left_speed, right_speed, 1.0)
+            last = time.monotonic()
             while not self._stop_event.is_set():
-                self._write(left_speed, right_speed)
-                time.sleep(self.cmd_period)
-                
-    def move_rover_thread(self,route):
-        # This function calculates the required motor commands to move the robot forward with the given speeds, 
-        # and optionally rotate by a certain angle or move a certain distance. If angle or distance is provided, 
-        # the function calculates the required duration for the movement and send the appropriate (multiple) motor commands
-        # a route is a list of segments, where each segment has a distance and angle to move, and the robot should execute them sequentially.
-        b.logger.debug(f"move_rover_thread called with route={route}")
-        for step in route or []:
+                now = time.monotonic()
+                scale = ramp.update(0.0, now - last)
+                last = now
+                self._write(left_speed * scale, right_speed * scale)
+                tick.wait(self._stop_event)
+            return False # only ends when stopped or preempted
+        return True
 
+    segment_poll_interval = 0.01 # s; progress check interval while a segment is about to reach its target
+
+    def _drive_segment(self, kind, target, duration, left, right, direction, source, speed):
+        # Send motor commands every cmd_period (periodic scheduler) until the progress measured from
+        # odometry reaches target. source(now) returns the odometry key to measure, or None when feedback is missing;
+        # then the progress is predicted from the commanded speed (open-loop, duration at full speed), continuing
+        # from the last measured progress. Each source is measured from its value at the start of the segment, or
+        # from the progress at which it first became available.
+        # The wheel speeds are scaled by the speed profile. A closed-loop segment is aborted after
+        # segment_timeout_factor x duration plus the profile ramp time. Returns False when interrupted or timed out.
+        start = time.monotonic()
+        deadline = start + duration * max(self.segment_timeout_factor, 1.0) + speed.ramp_time()
+        nominal_rate = target / duration if duration > 0 else 0.0 # open-loop progress per second at full speed
+        scale = 0.0
+        previous = start # time of the previous loop, for the open-loop prediction
+        speed_time = None # time of the previous profile update
+        # odometry values at zero progress
+        origin = {key: self._measured(key, start) for key in ("distance", "wheel_angle", "heading")
+                  if self.odometry[key] is not None}
+        progress = 0.0
+        open_time = 0.0 # seconds run on predicted progress
+        last = None # (time, progress) of the last progress change
+        rate = 0.0 # measured progress per second, to estimate when the target is reached
+        if self.closed_loop and source(start) is None:
+            self.enable_feedback_flow() # the firmware may have been reset since the start
+        tick = b.scheduler("motor_commands", self.cmd_period, immediate=True)
+        while True:
+            if self._stop_event.is_set():
+                b.logger.info(f"Movement {kind} interrupted by stop event")
+                return False
+            now = time.monotonic()
+            wake = None
+            key = source(now)
+            if key is not None:
+                value = self._measured(key, now)
+                origin.setdefault(key, value - direction * progress)
+                progress = direction * (value - origin[key])
+                if progress >= target:
+                    break
+                if now >= deadline:
+                    b.logger.warning(f"Movement {kind} timed out after {now - start:.2f} s at {progress:.3f} of {target:.3f}")
+                    self._write(0.0, 0.0)
+                    return False
+                if last is None or progress != last[1]:
+                    if last is not None and progress > last[1]:
+                        rate = (progress - last[1]) / max(now - last[0], 1e-6)
+                    last = (now, progress)
+                if rate > 0:
+                    # check again when the target should be reached instead of overshooting up to one cmd_period,
+                    # and keep polling when that moment passed before new feedback arrived
+                    wake = max(last[0] + (target - progress) / rate, now + self.segment_poll_interval)
+            else:
+                progress += scale * nominal_rate * (now - previous)
+                open_time += now - previous
+                if progress >= target:
+                    break
+                if scale > 0 and nominal_rate > 0:
+                    wake = now + (target - progress) / (scale * nominal_rate)
+            previous = now
+            if tick.due(now):
+                scale = speed.update(progress, self.cmd_period if speed_time is None else now - speed_time)
+                speed_time = now
+                self._write(left * scale, right * scale)
+            wake = tick.deadline if wake is None else min(wake, tick.deadline)
+            self._stop_event.wait(max(0.0, wake - time.monotonic()))
+        elapsed = time.monotonic() - start
+        if not self.closed_loop:
+            b.logger.info(f"Motion {kind} {target:.3f} done in {elapsed:.2f} s (open-loop, predicted {progress:.3f})")
+        elif open_time > 0:
+            # closed_loop is set but feedback was missing or stale, part of the segment was timed instead of measured
+            self._open_loop_segments += 1
+            b.logger.warning(f"Motion {kind} {target:.3f} done in {elapsed:.2f} s, {open_time:.2f} s of it open-loop "
+                             f"without fresh feedback (feedback_timeout {self.feedback_timeout} s)")
+        else:
+            b.logger.info(f"Motion {kind} {target:.3f} done in {elapsed:.2f} s (closed-loop, measured {progress:.3f})")
+        return True
+
+    def start_motion_executor(self):
+        # One long-lived thread executes all routes from the route queue
+        self.motion_thread = threading.Thread(target=self._motion_loop, name="motion_executor", daemon=True)
+        self.motion_thread.start()
+
+    def queue_route(self, route_id, route, mode="append"):
+        # Queue a route for the motion executor. append runs it after the queued routes. replace drops the queued
+        # routes and preempts the running one without a stop in between. clear drops everything and stops.
+        dropped = []
+        with self._route_cond:
+            if mode in ("replace", "clear"):
+                dropped = list(self._routes)
+                self._routes.clear()
+                if self._active_route is not None:
+                    self._abort_cause = "preempted" if mode == "replace" else "cleared"
+                    self._stop_event.set()
+            if mode != "clear":
+                self._routes.append((route_id, route))
+            self._route_cond.notify()
+        for dropped_id, dropped_route in dropped:
+            self._goal_event(orover.event.goalFailed, dropped_id, dropped_route, 0, 0.0, "replaced" if mode == "replace" else "cleared")
+
+    def _cancel_routes(self, cause):
+        # Drop all queued routes and abort the running one
+        with self._route_cond:
+            dropped = list(self._routes)
+            self._routes.clear()
+            if self._active_route is not None and self._abort_cause is None:
+                self._abort_cause = cause
+            self._stop_event.set() # CvK Stop
+        for dropped_id, dropped_route in dropped:
+            self._goal_event(orover.event.goalFailed, dropped_id, dropped_route, 0, 0.0, cause)
+
+    def _motion_loop(self):
+        # Motion executor: take the next route from the queue, run it and report the result per route id.
+        # The motors are only stopped when the queue is empty, so queued routes follow each other without dead time.
+        while b.running:
+            with self._route_cond:
+                if not self._routes:
+                    self._route_cond.wait(0.5)
+                    continue
+                route_id, route = self._routes.popleft()
+                self._active_route = route_id
+                self._abort_cause = None
+                self._stop_event.clear() # CvK Clear stop event before starting motion
+            h.ismoving = True
+            start = time.monotonic()
+            completed = self.run_route(route)
+            with self._route_cond:
+                self._active_route = None
+                cause = self._abort_cause
+                idle = not self._routes
+            if completed == len(route) and cause is None:
+                self._goal_event(orover.event.goalReached, route_id, route, completed, time.monotonic() - start,
+                                 open_loop=self._open_loop_segments)
+            else:
+                self._goal_event(orover.event.goalFailed, route_id, route, completed, time.monotonic() - start,
+                                 cause or "timeout", open_loop=self._open_loop_segments)
+            if idle:
+                self._write(0.0, 0.0)
+                h.ismoving = False
+
+    def _goal_event(self, reason, route_id, route, completed, duration, cause=None, open_loop=0):
+        # Publish event.goalReached or event.goalFailed for a route. open_loop counts the segments that ran (partly)
+        # open-loop although closed_loop is set.
+        body = {"route_id": route_id, "steps": len(route or []), "completed": completed, "duration_s": round(duration, 3)}
+        if cause is not None:
+            body["cause"] = cause
+        if open_loop:
+            body["open_loop_segments"] = open_loop
+        b.logger.info(f"Route {route_id} {'reached' if cause is None else 'failed (' + cause + ')'}: {completed}/{body['steps']} steps in {duration:.2f} s")
+        b.send_event(src=orover.origin.orover_ugv, reason=reason, body=body)
+
+    def run_route(self, route):
+        # Execute the steps of a route sequentially, each through _move_segment. A step has a distance and/or angle
+        # and optional wheel speeds; the linear speed is the default. With merge_steps consecutive straight steps
+        # and consecutive rotations are executed as one motion. Returns the number of completed steps.
+        b.logger.debug(f"run_route called with route={route}")
+        self._open_loop_segments = 0
+        if self.merge_steps:
+            motions = trajectory.merge_steps(route, self.linear_speed)
+        else:
+            motions = [dict(step, steps=1) for step in route]
+        completed = 0 if motions else len(route) # only zero length steps, nothing to drive
+        for motion in motions:
             if self._stop_event.is_set(): # CvK Stop
                 b.logger.info("Route aborted by stop_event")
                 break
-            if not h.ismoving:
-                b.logger.debug("move_rover_thread stopping early because ismoving was cleared")
+            if not self._move_segment(motion.get("left_speed", self.linear_speed), motion.get("right_speed", self.linear_speed),
+                                      motion.get("distance"), motion.get("angle")):
                 break
-            if "left_speed" not in step:
-                step["left_speed"] = self.linear_speed
-            if "right_speed" not in step:
-                step["right_speed"] = self.linear_speed
-            if "distance" not in step:
-                step["distance"] = None
-            if "angle" not in step:                   
-                step["angle"] = None
-            self._move_segment(step.get("left_speed"), step.get("right_speed"), step.get("distance"), step.get("angle"))
-        self._stop()
+            completed += motion["steps"]
+        return completed
 
     def _write(self, left, right):
-        cmd = json.dumps({"T": 1, "L": round(left, 2), "R": round(right, 2)}) + "\n"
-        self.serial_port.write(cmd.encode())
+        # Motor command {"T":1,"L":..,"R":..}. Speeds are quantized to 0.01 m/s and the encoded frame is cached per
+        # speed pair. A frame identical to the previous one is skipped until resend_interval has passed, which keeps
+        # the firmware heartbeat (HEART_BEAT_DELAY) alive. Stop frames are always sent.
+        key = (round(left * 100), round(right * 100))
+        # look up, compare, send and store under one lock, the motion executor and the handlers both write motor
+        # commands
+        with self._write_lock:
+            self._last_wheels = (key[0] / 100, key[1] / 100)
+            frame = self._motor_frames.get(key)
+            if frame is None:
+                if len(self._motor_frames) >= 256:
+                    self._motor_frames.clear()
+                frame = json.dumps({"T": 1, "L": key[0] / 100, "R": key[1] / 100}).encode() + b"\n"
+                self._motor_frames[key] = frame
+            now = time.monotonic()
+            if key != (0, 0) and frame is self._last_motor_frame and now - self._last_motor_write < self.resend_interval:
+                self.write_stats["skipped"] += 1
+                return
+            self._send_frame(frame)
+            self._last_motor_frame = frame
+            self._last_motor_write = now
+
+    def record_stop_latency(self, latency_ms):
+        # Keep statistics of the end-to-end stop latency, from sensor read to the serial stop command
+        self.stop_latency["count"] += 1
+        self.stop_latency["last_ms"] = round(latency_ms, 3)
+        self.stop_latency["max_ms"] = max(self.stop_latency["max_ms"], round(latency_ms, 3))
+        self.stop_latency["total_ms"] += latency_ms
+        b.logger.info(f"Stop latency {latency_ms:.1f} ms (max {self.stop_latency['max_ms']:.1f} ms over {self.stop_latency['count']} stops)")
 
     def _stop(self):
-        self._stop_event.set() # CvK Stop
+        # Stop now: drop the queued routes, abort the running one and write the stop frame from the calling thread
+        self._cancel_routes("stopped")
         self._write(0.0, 0.0)
         h.ismoving = False
     
@@ -515,20 +963,30 @@ class base(baseprocess):
         handle_serial() to process incoming serial data. The base class provides the infrastructure for message 
         handling and communication with the bus, while the handler class contains the specific logic for handling UGV-related messages.
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._safety_seen = collections.deque(maxlen=64) # ids of safety events received via the safety channel
+
+    def process_message(self, topic, msg):
+        # Safety events arrive twice: directly via the safety channel and later via the bus. Handle them once.
+        if msg.get("reason") in orover.SAFETY_REASONS:
+            if msg.get("id") in self._safety_seen:
+                return None
+            self._safety_seen.append(msg.get("id"))
+        return super().process_message(topic, msg)
+
+    poll_timeout = 100 # ms; the poller wakes up immediately for bus and safety input, this only bounds the running check
+
     def run(self):
-        # Main loop to receive messages from the bus and handle them, runs until termination signal is received
-        self.fetchtopics() # Fetch the topics and handlers before starting the main loop
+        # Main loop to receive messages from the bus, runs until termination signal is received.
+        # Serial input is handled by the reader and parser threads of the ugv class.
         while self.running:
-            # read topic and message from the SUB socket, then handle the message
-            events = dict(self.poller.poll(timeout=10))
+            events = dict(self.poller.poll(timeout=self.poll_timeout))
+            # safety events first, then the SUB socket
+            if self.safety is not None and self.safety in events:
+                self.receive_pending(self.safety)
             if self.sub in events:
-                topicmsg = self.sub.recv_string()
-                self.handle_message(topicmsg)
-
-            # Check for serial data regardless of zmq events, to ensure we don't miss any incoming data
-            data = ugv.serial_port.read(1024)
-            if data:
-                ugv.handle_serial_input(data)
+                self.receive_pending(self.sub)
 
 
 #### Main execution starts here ####
@@ -540,6 +998,11 @@ if __name__ == "__main__":
 
     b.poller = zmq.Poller()
     b.poller.register(b.sub, zmq.POLLIN)
+    b.safety = b.create_safety_socket(b.ctx) # Direct channel for stop events from sensor processes, bypassing the bus
+    if b.safety is not None:
+        b.poller.register(b.safety, zmq.POLLIN)
+    ugv.start_serial_threads() # Serial reader and parser run next to the bus loop
+    ugv.start_motion_executor() # Executes queued routes
 
     try:
         b.run()